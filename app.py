@@ -1,46 +1,232 @@
 import streamlit as st
 import pandas as pd
 from supabase import create_client, Client
-import base64
 import os
 from datetime import datetime
 import pytz
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, NamedTuple
 from dataclasses import dataclass, field
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import numpy as np
+import json
+import sys
+from array import array
+import threading
+import time
+import re
+import functools
+import inspect
+import heapq
+import csv
+import io
+import tempfile
+import shutil
+import hashlib
+import importlib.util
+import logging
+from collections import OrderedDict, defaultdict, deque
+
+_SCRIPT_START = time.perf_counter()  # rerun-profiel: telt vanaf hier, dus met alle definities hieronder
 
 # =============================================================================
 # 0. WAKE-UP LOGIC
 # =============================================================================
 def wake_up_app(service):
-    """Laadt de eerste set data in de cache om de app warm te draaien."""
+    """Laadt de voorraad (uit de snapshot of de database) zodat de eerste gebruiker niet wacht."""
     try:
         service.laad_data("", 0)
         return True
-    except:
+    except Exception as e:
+        service.repo.metrics.record("wake_up", 0.0, fout=e)
         return False
 
 # =============================================================================
 # 1. CONFIGURATIE & DATA CLASSES
 # =============================================================================
 
-st.set_page_config(layout="wide", page_title="Voorraad glas", page_icon="theunissen.webp")
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
+@st.cache_resource
+def laad_favicon() -> bytes:
+    """Kleine PNG van het logo; een bestandspad laat Streamlit de webp elke rerun opnieuw coderen (~50 ms)."""
+    from PIL import Image
+    with Image.open(os.path.join(STATIC_DIR, "theunissen.webp")) as img:
+        img.thumbnail((64, 64))
+        buf = io.BytesIO()
+        img.convert("RGBA").save(buf, format="PNG")
+    return buf.getvalue()
+
+st.set_page_config(layout="wide", page_title="Voorraad glas", page_icon=laad_favicon())
 
 LOCATIE_OPTIES = [
     "BK", "B0", "B1", "B2", "B3", "B4", "B5", "B6", "B7", "B8", "B9", "B10", 
     "B11", "B12", "B13", "B14", "B15", "B16", "B17", "B18", "B19", "B20", "W0",
     "W1", "W2", "W3", "W4", "W5", "W6", "W7", "W8", "W9", "W10"
 ]
+MAAT_MODI = {"marge": "± marge", "past": "Past in sparing", "minimaal": "Minimaal (uitsnijden)"}
 AMSTERDAM_TZ = pytz.timezone("Europe/Amsterdam")
+PAGE_SIZE = 250
+FETCH_BATCH = 1000  # Supabase max_rows: groter dan dit kapt de API stilletjes af
+SYNC_INTERVAL_SEC = 5
+SYNC_OVERLAP_SEC = 10
+GATHER_TIMEOUT_SEC = 8
+SCAN_TIMEOUT_SEC = 120  # volledige id-scan (N / FETCH_BATCH round-trips), alleen op de achtergrond
+FULL_RELOAD_TTL_SEC = 600
+PRESENCE_INTERVAL_SEC = 60
+ONLINE_TTL_SEC = 15
+PERF_VENSTER = 500  # metingen per operatie voor p50/p95
+PERF_LOG = os.environ.get("VOORRAAD_PERF_LOG")  # pad voor JSON-lines, of "-" voor stdout
+PROFIEL = os.environ.get("VOORRAAD_PROFIEL") == "1"  # rerun-profiel altijd tonen (anders via ?profiel=1)
+SEARCH_COLUMNS = ("order_nummer", "omschrijving", "locatie")
+DB_KOLOMMEN = ["id", "locatie", "aantal", "breedte", "hoogte", "order_nummer", "omschrijving"]
+EDITOR_KOLOMMEN = ["Selecteren", "locatie", "aantal", "breedte", "hoogte", "order_nummer", "omschrijving", "id"]
+INT_KOLOMMEN = ("aantal", "breedte", "hoogte")
+IMPORT_BATCH = 500
+IMPORT_VOORTGANG_RIJEN = 200  # zo vaak (in gelezen rijen) wordt de importvoortgang bijgewerkt
+ID_BATCH = 200  # ids per in_()-filter; houdt de URL ruim onder de limiet van PostgREST
+UPSERT_BATCH = 500
+MUTATIE_WORKERS = 4
+MUTATIE_POGINGEN = 3
+MUTATIE_WACHT_SEC = 0.5  # verdubbelt per nieuwe poging
+EDIT_DEBOUNCE_SEC = 4  # zo lang na de laatste inline-wijziging wordt automatisch opgeslagen
+ZOEK_CACHE_MAX = 32  # zoekresultaten per store (LRU); elke tussenstand van het typen is een eigen term
+EXPORT_FORMATEN = {
+    "csv": ("CSV (Excel NL)", "text/csv"),
+    "xlsx": ("Excel (.xlsx)", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "parquet": ("Parquet", "application/vnd.apache.parquet"),
+}
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024  # daarboven schrijft de export naar schijf i.p.v. geheugen
+UNDO_MAX_STAPPEN = 10
+UNDO_MAX_BYTES = 4 * 1024 * 1024
+UNDO_DIR = os.environ.get("VOORRAAD_UNDO_DIR")  # optioneel: undo-log per gebruiker op schijf
+# Warme snapshot van de voorraad op lokale schijf; een lege waarde zet dit uit.
+SNAPSHOT_DIR = os.environ.get("VOORRAAD_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "voorraad_snapshot"))
+SNAPSHOT_INTERVAL_SEC = 60  # na wijzigingen hooguit zo vaak opnieuw wegschrijven
+SNAPSHOT_OPRUIM_SEC = 600  # oudere snapshot-mappen dan dit (behalve de actuele) worden verwijderd
+
+class MaatZoek(NamedTuple):
+    # NamedTuple i.p.v. dataclass: blijft vergelijkbaar nadat Streamlit het script opnieuw uitvoert.
+    breedte: int = 0
+    hoogte: int = 0
+    marge: int = 20
+    modus: str = "marge"
+
+    @property
+    def actief(self) -> bool:
+        return self.breedte > 0 and self.hoogte > 0
+
+def rij_bijdrage(rij) -> Tuple[str, int, float]:
+    """(locatie, aantal, m²) van één rij; werkt op dicts en op pandas-rijen met NA."""
+    a, b, h, loc = (rij.get(k) for k in ("aantal", "breedte", "hoogte", "locatie"))
+    aantal = int(a) if pd.notna(a) else 0
+    m2 = float(b) * float(h) * aantal / 1e6 if pd.notna(b) and pd.notna(h) else 0.0
+    return (loc if pd.notna(loc) and loc else "?", aantal, m2)
+
+class Selectie:
+    """Geselecteerde ids met lopende totalen: ruiten, m² en een uitsplitsing per locatie.
+
+    Elke rij levert een vaste bijdrage die bij aan- en uitvinken als O(1)-delta wordt
+    verrekend. Alleen als de voorraad zelf wijzigt, rekent `ververs` alles opnieuw uit.
+    """
+
+    def __init__(self):
+        self.ids: set = set()
+        self._bijdrage: Dict[int, Tuple[str, int, float]] = {}
+        self.ruiten, self.m2 = 0, 0.0
+        self.per_locatie: Dict[str, List] = {}  # locatie -> [regels, ruiten, m²]
+        self.versie = None
+
+    def __len__(self): return len(self.ids)
+    def __contains__(self, rid): return rid in self.ids
+    def __iter__(self): return iter(self.ids)
+
+    def _verreken(self, bijdrage: Tuple[str, int, float], teken: int):
+        loc, aantal, m2 = bijdrage
+        self.ruiten += teken * aantal
+        self.m2 += teken * m2
+        t = self.per_locatie.setdefault(loc, [0, 0, 0.0])
+        t[0] += teken; t[1] += teken * aantal; t[2] += teken * m2
+        if t[0] == 0: del self.per_locatie[loc]
+
+    def add(self, rid: int, rij):
+        if rid in self.ids: return
+        self.ids.add(rid)
+        self._bijdrage[rid] = b = rij_bijdrage(rij)
+        self._verreken(b, 1)
+
+    def discard(self, rid: int):
+        if rid not in self.ids: return
+        self.ids.discard(rid)
+        self._verreken(self._bijdrage.pop(rid), -1)
+
+    def update(self, rijen: List[Dict[str, Any]]):
+        for r in rijen: self.add(r["id"], r)
+
+    def clear(self):
+        self.__init__()
+
+    def ververs(self, store: "InventoryStore"):
+        """Volgt wijzigingen in de voorraad (ook van anderen); verdwenen rijen vallen uit de selectie."""
+        if self.versie == store.version: return
+        ids = self.ids
+        self.clear()
+        self.update(store.get(list(ids)))
+        self.versie = store.version
+
+    def tabel(self) -> pd.DataFrame:
+        return pd.DataFrame([{"locatie": k, "regels": v[0], "ruiten": v[1], "m²": round(v[2], 2)}
+                             for k, v in sorted(self.per_locatie.items())])
+
+class EditBuffer:
+    """Inline-wijzigingen, samengevoegd per id en kolom tot één batch bij het opslaan.
+
+    `basis` is de rij zoals die was bij de eerste wijziging: bron voor de undo-snapshot
+    en, via updated_at, voor het herkennen van tussentijdse wijzigingen door anderen.
+    """
+
+    def __init__(self, generatie: int = 0):
+        self.wijzigingen: Dict[int, Dict[str, Any]] = {}
+        self.basis: Dict[int, Dict[str, Any]] = {}
+        self.laatst = 0.0
+        self.generatie = generatie  # telt per clear(); onderdeel van de editor-key
+        self.autosave = True  # uit na een mislukte autosave; alleen OPSLAAN probeert het dan opnieuw
+
+    def __len__(self): return sum(len(w) for w in self.wijzigingen.values())
+
+    def zet(self, rid: int, kolom: str, waarde: Any, rij: Dict[str, Any]):
+        if kolom in INT_KOLOMMEN and isinstance(waarde, float) and waarde.is_integer(): waarde = int(waarde)
+        basis = self.basis.setdefault(rid, dict(rij))
+        w = self.wijzigingen.setdefault(rid, {})
+        if w.get(kolom, basis.get(kolom)) != waarde: self.laatst = time.time()
+        if basis.get(kolom) == waarde: w.pop(kolom, None)
+        else: w[kolom] = waarde
+        if not w:
+            del self.wijzigingen[rid], self.basis[rid]
+
+    def overlay(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Toont openstaande wijzigingen in het editorframe, ook na bladeren of een sync."""
+        for pos in np.flatnonzero(df["id"].isin(list(self.wijzigingen))):
+            for kolom, waarde in self.wijzigingen[int(df["id"].iat[pos])].items():
+                df.iloc[pos, df.columns.get_loc(kolom)] = waarde
+        return df
+
+    def clear(self):
+        """Leegt de buffer en geeft de editor een nieuwe key: anders blijven de oude edited_rows
+        in het widget staan en komen ze bij de volgende wijziging opnieuw in de buffer."""
+        self.__init__(self.generatie + 1)
 
 @dataclass
 class AppState:
     ingelogd: bool = False
     gebruikersnaam: str = "" 
     mijn_data: pd.DataFrame = field(default_factory=pd.DataFrame)
+    getoond: Dict[int, Dict[str, Any]] = field(default_factory=dict)  # rijen zoals getoond, basis voor edits
     bulk_loc: str = "BK"
     zoek_veld: str = ""
+    zoek_modus: str = "tekst"
+    maat_zoek: MaatZoek = field(default_factory=MaatZoek)
     last_query: str = None
     confirm_delete: bool = False  
     confirm_undo: bool = False    
@@ -48,19 +234,238 @@ class AppState:
     current_page: int = 0
     loc_prefix: str = "B"
     success_msg: str = ""
-    selected_ids: set = field(default_factory=set)
-    undo_stack: List[Dict[str, Any]] = field(default_factory=list) 
+    selectie: Selectie = field(default_factory=lambda: Selectie())
+    edit_buffer: EditBuffer = field(default_factory=lambda: EditBuffer())
+    undo_log: "UndoLog" = field(default_factory=lambda: UndoLog())
     total_count: int = 0
+    import_resultaat: Optional[Any] = None
+    show_perf: bool = False
+    show_overzicht: bool = False
+    paneel: Optional[str] = None  # open paneel onderaan: toevoegen / import / export
+    fout_msg: str = ""
+
+    def reset_paging(self):
+        self.current_page = 0
+
+# =============================================================================
+# 2. INSTRUMENTATIE
+# =============================================================================
+
+class PerfMetrics:
+    """Rollende, proces-brede meetwaarden per operatie (wandtijd, rijen, bytes, cache, fouten).
+
+    Met VOORRAAD_PERF_LOG gaat elke meting daarnaast als JSON-regel naar een
+    bestand of stdout, zodat trage momenten achteraf terug te vinden zijn.
+    """
+
+    def __init__(self, venster: int = PERF_VENSTER, log_pad: Optional[str] = PERF_LOG):
+        self.lock = threading.Lock()
+        self.per_operatie: Dict[str, deque] = defaultdict(lambda: deque(maxlen=venster))
+        self.log = None
+        if log_pad:
+            self.log = logging.getLogger("voorraad.perf")
+            self.log.propagate = False
+            if not self.log.handlers:
+                self.log.addHandler(logging.StreamHandler(sys.stdout) if log_pad == "-" else logging.FileHandler(log_pad))
+            self.log.setLevel(logging.INFO)
+
+    def record(self, operatie: str, seconden: float, rijen: Optional[int] = None, bytes_: Optional[int] = None,
+               cache: Optional[str] = None, fout: Optional[BaseException] = None):
+        meting = {"ts": time.time(), "operatie": operatie, "ms": round(seconden * 1000, 3), "rijen": rijen,
+                  "bytes": bytes_, "cache": cache, "fout": f"{type(fout).__name__}: {fout}" if fout else None}
+        with self.lock:
+            self.per_operatie[operatie].append(meting)
+        if self.log: self.log.info(json.dumps(meting))
+
+    @contextmanager
+    def meet(self, operatie: str, cache: Optional[str] = None):
+        t0, fout = time.perf_counter(), None
+        try:
+            yield
+        except Exception as e:
+            fout = e
+            raise
+        finally:
+            self.record(operatie, time.perf_counter() - t0, cache=cache, fout=fout)
+
+    def samenvatting(self) -> pd.DataFrame:
+        with self.lock:
+            per_op = {k: list(v) for k, v in self.per_operatie.items()}
+        rijen = []
+        for op, metingen in sorted(per_op.items()):
+            ms = np.array([m["ms"] for m in metingen])
+            rijen_ = [m["rijen"] for m in metingen if m["rijen"] is not None]
+            caches = [m["cache"] for m in metingen if m["cache"]]
+            fouten = [m["fout"] for m in metingen if m["fout"]]
+            rijen.append({
+                "operatie": op, "aantal": len(metingen),
+                "p50 ms": round(float(np.percentile(ms, 50)), 1), "p95 ms": round(float(np.percentile(ms, 95)), 1),
+                "max ms": round(float(ms.max()), 1),
+                "rijen gem.": round(float(np.mean(rijen_)), 1) if rijen_ else None,
+                "kB totaal": round(sum(m["bytes"] or 0 for m in metingen) / 1024, 1),
+                "cache hit %": round(100 * caches.count("hit") / len(caches), 1) if caches else None,
+                "fouten": len(fouten), "laatste fout": fouten[-1] if fouten else "",
+            })
+        return pd.DataFrame(rijen)
+
+    def export_json(self) -> str:
+        with self.lock:
+            return json.dumps([m for v in self.per_operatie.values() for m in v], default=str)
+
+    def reset(self):
+        with self.lock:
+            self.per_operatie.clear()
+
+class RerunProfiel:
+    """Tijd per sectie van één volledige rerun, vanaf de eerste regel van het script.
+
+    Elke sectie gaat als `rerun.<naam>` naar PerfMetrics (dus ook p50/p95 in het
+    admin-paneel); de uitsplitsing van de huidige rerun is zichtbaar met ?profiel=1.
+    """
+
+    def __init__(self, metrics: PerfMetrics, start: float):
+        self.metrics, self.start = metrics, start
+        self.secties: List[Tuple[str, float]] = []
+        self._noteer("script", time.perf_counter() - start)  # imports, definities, set_page_config
+
+    def _noteer(self, naam: str, seconden: float):
+        self.secties.append((naam, seconden))
+        self.metrics.record(f"rerun.{naam}", seconden)
+
+    @contextmanager
+    def sectie(self, naam: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._noteer(naam, time.perf_counter() - t0)
+
+    def afsluiten(self, tonen: bool):
+        totaal = time.perf_counter() - self.start
+        self.metrics.record("rerun.totaal", totaal)
+        if tonen:
+            st.caption(f"⏱️ Rerun {totaal * 1000:.0f} ms: " + " · ".join(f"{n} {s * 1000:.0f}" for n, s in self.secties))
+
+def _omvang(resultaat: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(rijen, geschatte payload-bytes); bytes via een steekproef om JSON-kosten te beperken."""
+    if isinstance(resultaat, tuple) and resultaat and isinstance(resultaat[0], list):
+        resultaat = resultaat[0]
+    if not isinstance(resultaat, list): return None, None
+    if not resultaat: return 0, 0
+    steekproef = resultaat[:20]
+    per_rij = len(json.dumps(steekproef, default=str)) / len(steekproef)
+    return len(resultaat), int(per_rij * len(resultaat))
+
+def instrumenteer(cls):
+    """Klasse-decorator: elke publieke methode van de repository wordt gemeten."""
+    def wrap(naam, fn):
+        @functools.wraps(fn)
+        def gemeten(self, *args, **kwargs):
+            if self.metrics is None: return fn(self, *args, **kwargs)
+            t0, res, fout = time.perf_counter(), None, None
+            try:
+                res = fn(self, *args, **kwargs)
+                return res
+            except Exception as e:
+                fout = e
+                raise
+            finally:
+                rijen, bytes_ = _omvang(res)
+                self.metrics.record(f"repo.{naam}", time.perf_counter() - t0, rijen, bytes_, fout=fout)
+        return gemeten
+    for naam, fn in list(vars(cls).items()):
+        # Generators niet: die worden pas later doorlopen; de pagina's zelf worden wel gemeten.
+        if callable(fn) and not naam.startswith("_") and naam != "gather" and not inspect.isgeneratorfunction(fn):
+            setattr(cls, naam, wrap(naam, fn))
+    return cls
 
 # =============================================================================
-# 2. DATABASE REPOSITORY LAAG
+# 3. DATABASE REPOSITORY LAAG
 # =============================================================================
 
+class BatchFout(Exception):
+    """Niet alle batches zijn gelukt; `gelukt` bevat de ids/records van de batches die wel zijn doorgevoerd."""
+
+    def __init__(self, operatie: str, gelukt: List[Any], oorzaak: Any, teruggedraaid: bool = False):
+        super().__init__(f"{operatie} mislukt: {oorzaak}")
+        self.operatie, self.gelukt, self.oorzaak, self.teruggedraaid = operatie, gelukt, oorzaak, teruggedraaid
+
+@instrumenteer
 class GlasVoorraadRepository:
-    def __init__(self, supabase_client: Client):
+    def __init__(self, supabase_client: Client, metrics: Optional[PerfMetrics] = None):
         self.client = supabase_client
         self.table = "glas_voorraad"
-    
+        self.metrics = metrics
+
+    def gather(self, calls: Dict[str, Tuple[Any, Any]], timeout: float = GATHER_TIMEOUT_SEC) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        """Voert onafhankelijke reads parallel uit: {naam: (functie, default)}.
+
+        De totale wachttijd is die van de traagste call, begrensd door `timeout`.
+        Een call die faalt of niet op tijd klaar is levert zijn default op en
+        komt in de foutenlijst; de andere resultaten blijven bruikbaar.
+        """
+        ctx = get_script_run_ctx()
+
+        def met_ctx(fn):
+            def run():
+                if ctx: add_script_run_ctx(threading.current_thread(), ctx)
+                return fn()
+            return run
+
+        pool = init_thread_pool()
+        futures = {naam: pool.submit(met_ctx(fn)) for naam, (fn, _) in calls.items()}
+        wait(futures.values(), timeout=timeout)
+        resultaten, fouten = {}, {}
+        for naam, fut in futures.items():
+            resultaten[naam] = calls[naam][1]
+            if not fut.done():
+                fouten[naam] = f"timeout na {timeout}s"
+            elif fut.exception() is not None:
+                fouten[naam] = str(fut.exception())
+            else:
+                resultaten[naam] = fut.result()
+        if self.metrics:
+            for naam, fout in fouten.items():
+                self.metrics.record(f"gather.{naam}", timeout if fout.startswith("timeout") else 0.0, fout=RuntimeError(fout))
+        return resultaten, fouten
+
+    def _in_batches(self, operatie: str, items: List[Any], fn, grootte: int = ID_BATCH, voortgang=None) -> List[Dict[str, Any]]:
+        """Voert `fn(batch)` per batch uit met beperkte parallelliteit en retry.
+
+        Geeft de samengevoegde `.data` terug. Faalt een batch na MUTATIE_POGINGEN, dan
+        worden nog niet gestarte batches geannuleerd en volgt een BatchFout met wat wél lukte.
+        """
+        batches = [items[i:i + grootte] for i in range(0, len(items), grootte)]
+
+        def met_retry(batch):
+            for poging in range(MUTATIE_POGINGEN):
+                try:
+                    return fn(batch).data or []
+                except Exception:
+                    if poging + 1 == MUTATIE_POGINGEN: raise
+                    time.sleep(MUTATIE_WACHT_SEC * 2 ** poging)
+
+        if len(batches) <= 1:
+            try:
+                return met_retry(batches[0]) if batches else []
+            except Exception as e:
+                raise BatchFout(operatie, [], e) from e
+        futures = {init_mutatie_pool().submit(met_retry, b): b for b in batches}
+        data, gelukt, fout, klaar = [], [], None, 0
+        for fut in as_completed(futures):
+            if fut.cancelled(): continue
+            if fut.exception() is not None:
+                if fout is None:
+                    fout = fut.exception()
+                    for f in futures: f.cancel()
+                continue
+            data.extend(fut.result()); gelukt.extend(futures[fut])
+            klaar += len(futures[fut])
+            if voortgang and fout is None: voortgang(klaar, len(items))
+        if fout is not None:
+            raise BatchFout(operatie, gelukt, fout) from fout
+        return data
+
     @contextmanager
     def _handle_errors(self, operation: str):
         try:
@@ -69,144 +474,1132 @@ class GlasVoorraadRepository:
             st.error(f"Database fout bij {operation}: {e}")
             raise
     
-    def get_all_data(self, zoekterm: str = "") -> Tuple[List[Dict[str, Any]], int]:
-        with self._handle_errors("ophalen data"):
-            query = self.client.table(self.table).select("*", count="exact")
+    @staticmethod
+    def _search_filter(zoekterm: str) -> str:
+        return ",".join(f"{c}.ilike.%{zoekterm}%" for c in SEARCH_COLUMNS)
+
+    def get_page(self, zoekterm: str = "", after_id: Optional[int] = None, limit: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+        """Keyset-paginering op id: haalt maximaal `limit` rijen op met id > after_id."""
+        with self._handle_errors("ophalen pagina"):
+            query = self.client.table(self.table).select("*")
             if zoekterm:
-                search_filter = f"order_nummer.ilike.%{zoekterm}%,omschrijving.ilike.%{zoekterm}%,locatie.ilike.%{zoekterm}%"
-                query = query.or_(search_filter)
-            
-            result = query.order("id").execute()
-            return result.data, result.count
-
-    def get_by_ids(self, ids: List[int]) -> List[Dict[str, Any]]:
-        if not ids: return []
-        res = self.client.table(self.table).select("*").in_("id", ids).execute()
-        return res.data
-
-    def get_all_matching_ids(self, zoekterm: str = "") -> List[int]:
-        query = self.client.table(self.table).select("id")
-        if zoekterm:
-            query = query.or_(f"order_nummer.ilike.%{zoekterm}%,omschrijving.ilike.%{zoekterm}%,locatie.ilike.%{zoekterm}%")
-        result = query.execute()
-        return [r['id'] for r in result.data]
-
-    def get_sum_aantal_for_ids(self, ids: List[int]) -> int:
-        if not ids: return 0
-        result = self.client.table(self.table).select("aantal").in_("id", ids).execute()
-        return sum(int(r['aantal'] or 0) for r in result.data)
-
-    def get_all_for_backup(self) -> List[Dict[str, Any]]:
-        res = self.client.table(self.table).select("*").execute()
-        return res.data
-    
+                query = query.or_(self._search_filter(zoekterm))
+            if after_id is not None:
+                query = query.gt("id", after_id)
+            return query.order("id").limit(limit).execute().data
+
+    def count_matching(self, zoekterm: str = "") -> int:
+        with self._handle_errors("tellen"):
+            query = self.client.table(self.table).select("id", count="exact", head=True)
+            if zoekterm:
+                query = query.or_(self._search_filter(zoekterm))
+            return query.execute().count or 0
+
+    def iter_pages(self, zoekterm: str = "", batch: int = FETCH_BATCH):
+        """Loopt alle pagina's af op id, zodat de API-rijlimiet niets afkapt."""
+        after_id = None
+        while True:
+            page = self.get_page(zoekterm, after_id, batch)
+            if page: yield page
+            if len(page) < batch: return
+            after_id = page[-1]["id"]
+
+    def get_all_data(self, zoekterm: str = "") -> Tuple[List[Dict[str, Any]], int]:
+        data = [r for page in self.iter_pages(zoekterm) for r in page]
+        return data, len(data)
+
+    def get_changed_since(self, since: str) -> List[Dict[str, Any]]:
+        """Delta-fetch: alle rijen met updated_at >= since, in keyset-pagina's."""
+        data, after_id = [], None
+        while True:
+            query = self.client.table(self.table).select("*").gte("updated_at", since)
+            if after_id is not None:
+                query = query.gt("id", after_id)
+            page = query.order("id").limit(FETCH_BATCH).execute().data
+            data.extend(page)
+            if len(page) < FETCH_BATCH: return data
+            after_id = page[-1]["id"]
+
+    def get_all_ids(self) -> List[int]:
+        ids, after_id = [], None
+        while True:
+            query = self.client.table(self.table).select("id")
+            if after_id is not None:
+                query = query.gt("id", after_id)
+            page = [r["id"] for r in query.order("id").limit(FETCH_BATCH).execute().data]
+            ids.extend(page)
+            if len(page) < FETCH_BATCH: return ids
+            after_id = page[-1]
+
+    def bestaande_ids(self, ids: List[int]) -> set:
+        """Welke van deze ids nog in de database staan; in batches van ID_BATCH."""
+        return {r["id"] for r in self._in_batches("controleren", ids, lambda b: self.client.table(self.table).select("id").in_("id", b).execute())}
+
     def insert_one(self, record: Dict[str, Any]):
         return self.client.table(self.table).insert(record).execute()
+
+    def insert_many(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self.client.table(self.table).insert(records).execute().data
     
-    def bulk_update_location(self, ids: List[int], nieuwe_locatie: str):
-        self.client.table(self.table).update({"locatie": nieuwe_locatie}).in_("id", ids).execute()
+    def bulk_update_location(self, ids: List[int], nieuwe_locatie: str, voortgang=None) -> List[Dict[str, Any]]:
+        return self._in_batches("verplaatsen", ids, lambda b: self.client.table(self.table).update({"locatie": nieuwe_locatie}).in_("id", b).execute(),
+                                voortgang=voortgang)
     
-    def bulk_update_fields(self, updates: List[Dict[str, Any]]):
-        self.client.table(self.table).upsert(updates).execute()
+    def bulk_update_fields(self, updates: List[Dict[str, Any]], voortgang=None) -> List[Dict[str, Any]]:
+        return self._in_batches("opslaan", updates, lambda b: self.client.table(self.table).upsert(b).execute(),
+                                grootte=UPSERT_BATCH, voortgang=voortgang)
     
-    def delete_many(self, ids: List[int]):
-        self.client.table(self.table).delete().in_("id", ids).execute()
+    def delete_many(self, ids: List[int], voortgang=None) -> List[Dict[str, Any]]:
+        return self._in_batches("verwijderen", ids, lambda b: self.client.table(self.table).delete().in_("id", b).execute(),
+                                voortgang=voortgang)
 
     def update_online_status(self, username: str):
         if not username: return
-        try:
-            self.client.table("active_sessions").upsert({
-                "username": username,
-                "last_seen": datetime.now(pytz.utc).isoformat()
-            }).execute()
-        except: pass
+        self.client.table("active_sessions").upsert({
+            "username": username,
+            "last_seen": datetime.now(pytz.utc).isoformat()
+        }).execute()
 
     def get_online_users(self) -> List[str]:
+        vijf_min_geleden = (datetime.now(pytz.utc) - pd.Timedelta(minutes=5)).isoformat()
+        res = self.client.table("active_sessions").select("username").gt("last_seen", vijf_min_geleden).execute()
+        return [r['username'].split('@')[0].capitalize() for r in res.data]
+
+# =============================================================================
+# 4. GEDEELDE STATE (CROSS-SESSION)
+# =============================================================================
+
+class SearchIndex:
+    """Trigram-index over de distinct waarden van SEARCH_COLUMNS.
+
+    Matcht zoals `kolom ILIKE '%term%'` op een van de kolommen. Elke distinct
+    (lowercase) waarde wordt één keer geïndexeerd; locaties en omschrijvingen
+    herhalen veel, dus de index blijft klein. Mutaties werken de index per id
+    bij, zonder herbouw.
+    """
+
+    def __init__(self):
+        self.row_values: Dict[int, frozenset] = {}
+        self.value_ids: Dict[str, set] = {}
+        self.trigrams: Dict[str, set] = defaultdict(set)
+
+    @staticmethod
+    def _values(record: Dict[str, Any]) -> frozenset:
+        return frozenset(v for v in (str(record.get(c) or "").lower() for c in SEARCH_COLUMNS) if v)
+
+    @staticmethod
+    def _trigrams(value: str) -> set:
+        return {value[i:i + 3] for i in range(len(value) - 2)}
+
+    @classmethod
+    def _index_grams(cls, value: str) -> set:
+        # Opvullen zodat elke substring van 1-2 tekens het begin van een trigram is.
+        return cls._trigrams(value + "\x00\x00")
+
+    def build(self, records: List[Dict[str, Any]]):
+        self.row_values, self.value_ids, self.trigrams = {}, {}, defaultdict(set)
+        for r in records: self.add(r)
+
+    def add(self, record: Dict[str, Any]):
+        rid, nieuw = record["id"], self._values(record)
+        oud = self.row_values.get(rid, frozenset())
+        if oud == nieuw: return
+        for v in oud - nieuw: self._unlink(v, rid)
+        for v in nieuw - oud: self._link(v, rid)
+        self.row_values[rid] = nieuw
+
+    def remove(self, rid: int):
+        for v in self.row_values.pop(rid, ()): self._unlink(v, rid)
+
+    def _link(self, value: str, rid: int):
+        ids = self.value_ids.get(value)
+        if ids is None:
+            ids = self.value_ids[value] = set()
+            for g in self._index_grams(value): self.trigrams[g].add(value)
+        ids.add(rid)
+
+    def _unlink(self, value: str, rid: int):
+        ids = self.value_ids[value]
+        ids.discard(rid)
+        if ids: return
+        del self.value_ids[value]
+        for g in self._index_grams(value):
+            self.trigrams[g].discard(value)
+            if not self.trigrams[g]: del self.trigrams[g]
+
+    def query(self, zoekterm: str) -> List[int]:
+        """Gesorteerde ids waarvan een van de kolommen de term bevat."""
+        term = zoekterm.lower()
+        if "%" in term or "_" in term:
+            regex = re.compile("".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in term), re.S)
+            waarden = [v for v in self.value_ids if regex.search(v)]
+        elif len(term) < 3:
+            waarden = set()
+            for g, vals in self.trigrams.items():
+                if g.startswith(term): waarden |= vals
+        else:
+            postings = sorted((self.trigrams.get(g, set()) for g in self._trigrams(term)), key=len)
+            kandidaten = postings[0].intersection(*postings[1:]) if postings[0] else ()
+            waarden = [v for v in kandidaten if term in v]
+        ids = set()
+        for v in waarden: ids |= self.value_ids[v]
+        return sorted(ids)
+
+class DimensionIndex:
+    """Gesorteerde index over (korte zijde, lange zijde) van elke ruit.
+
+    Door beide kanten te normaliseren telt een gedraaide ruit (breedte en
+    hoogte verwisseld) automatisch ook als match.
+    """
+
+    def __init__(self, records):
+        maten = [(r["id"], r.get("breedte"), r.get("hoogte")) for r in records]
+        maten = [m for m in maten if m[1] and m[2]]
+        ids = np.fromiter((m[0] for m in maten), dtype=np.int64, count=len(maten))
+        b = np.fromiter((m[1] for m in maten), dtype=np.int64, count=len(maten))
+        h = np.fromiter((m[2] for m in maten), dtype=np.int64, count=len(maten))
+        kort, lang = np.minimum(b, h), np.maximum(b, h)
+        volgorde = np.argsort(kort, kind="stable")
+        self.ids, self.kort, self.lang = ids[volgorde], kort[volgorde], lang[volgorde]
+
+    def query(self, maat: MaatZoek) -> List[int]:
+        """Ids gerangschikt op best passend: kleinste afwijking of minste snijverlies."""
+        k, l = sorted((maat.breedte, maat.hoogte))
+        if maat.modus == "past": lo, hi = 0, k
+        elif maat.modus == "minimaal": lo, hi = k, np.iinfo(np.int64).max
+        else: lo, hi = k - maat.marge, k + maat.marge
+        start, eind = np.searchsorted(self.kort, lo, "left"), np.searchsorted(self.kort, hi, "right")
+        ids, kort, lang = self.ids[start:eind], self.kort[start:eind], self.lang[start:eind]
+        if maat.modus == "past":
+            mask = lang <= l
+            score = k * l - kort * lang
+        elif maat.modus == "minimaal":
+            mask = lang >= l
+            score = kort * lang - k * l
+        else:
+            mask = np.abs(lang - l) <= maat.marge
+            score = np.abs(kort - k) + np.abs(lang - l)
+        ids, score = ids[mask], score[mask]
+        return ids[np.lexsort((ids, score))].tolist()
+
+def bouw_frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Kolomsgewijs frame met vast schema, geïndexeerd op id.
+
+    Nullable Int32 voor maten/aantallen, categorical locatie over LOCATIE_OPTIES
+    (plus eventuele onbekende waarden), string voor vrije tekst.
+    """
+    return bouw_frame_kolommen({c: [r.get(c) for r in records] for c in DB_KOLOMMEN})
+
+def _int32_kolom(waarden) -> pd.api.extensions.ExtensionArray:
+    """Nullable Int32 uit een lijst, of zonder omweg uit een int64-array met _INT_NULL-markering."""
+    if not isinstance(waarden, np.ndarray): return pd.array(waarden, dtype="Int32")
+    leeg = waarden == _INT_NULL
+    return pd.arrays.IntegerArray(np.where(leeg, 0, waarden).astype(np.int32), leeg)
+
+def bouw_frame_kolommen(kol: Dict[str, Any]) -> pd.DataFrame:
+    extra = sorted({v for v in kol["locatie"] if v is not None and v not in LOCATIE_OPTIES})
+    ids = np.asarray(kol["id"], dtype=np.int64)
+    return pd.DataFrame({
+        "locatie": pd.Categorical(kol["locatie"], categories=LOCATIE_OPTIES + extra),
+        **{c: _int32_kolom(kol[c]) for c in INT_KOLOMMEN},
+        "order_nummer": pd.array(kol["order_nummer"], dtype="string"),
+        "omschrijving": pd.array(kol["omschrijving"], dtype="string"),
+        "id": ids,
+    }, index=pd.Index(ids, name="rid"))
+
+class LocatieOverzicht:
+    """Totalen per locatie (regels, ruiten, m², oudste invoer), per gewijzigde rij bijgewerkt.
+
+    De oudste invoer staat per locatie in een heap; rijen die verplaatst of verwijderd
+    zijn blijven daar staan tot ze bovenaan komen en worden dan pas weggegooid.
+    """
+
+    def __init__(self):
+        self.build([])
+
+    def build(self, rows):
+        self.totalen: Dict[str, List] = defaultdict(lambda: [0, 0, 0.0])
+        self._oudste: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+        self._actueel: Dict[int, Tuple[str, Optional[str]]] = {}
+        for r in rows: self.add(r)
+
+    def add(self, rij: Dict[str, Any]):
+        loc, aantal, m2 = rij_bijdrage(rij)
+        t = self.totalen[loc]
+        t[0] += 1; t[1] += aantal; t[2] += m2
+        created = rij.get("created_at")
+        self._actueel[rij["id"]] = (loc, created)
+        if created:
+            heap = self._oudste[loc]
+            heapq.heappush(heap, (created, rij["id"]))
+            if len(heap) > 2 * t[0] + 64:
+                heap[:] = [e for e in set(heap) if self._actueel.get(e[1]) == (loc, e[0])]
+                heapq.heapify(heap)
+
+    def remove(self, rij: Dict[str, Any]):
+        loc, aantal, m2 = rij_bijdrage(rij)
+        t = self.totalen[loc]
+        t[0] -= 1; t[1] -= aantal; t[2] -= m2
+        if t[0] == 0: del self.totalen[loc]
+        self._actueel.pop(rij["id"], None)
+
+    def oudste(self, loc: str) -> Optional[str]:
+        heap = self._oudste.get(loc)
+        while heap and self._actueel.get(heap[0][1]) != (loc, heap[0][0]):
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def tabel(self) -> pd.DataFrame:
+        locaties = LOCATIE_OPTIES + sorted(set(self.totalen) - set(LOCATIE_OPTIES))
+        return pd.DataFrame([{"locatie": loc, "regels": self.totalen[loc][0] if loc in self.totalen else 0,
+                              "ruiten": self.totalen[loc][1] if loc in self.totalen else 0,
+                              "m²": round(self.totalen[loc][2], 2) if loc in self.totalen else 0.0,
+                              "oudste": self.oudste(loc)} for loc in locaties])
+
+class VoorraadSnapshot:
+    """Kolomsgewijze kopie van de voorraad op schijf, voor een koude start zonder database.
+
+    Gehele getallen staan als .npy, tekstkolommen als één utf-8 blob met offsets in tekens,
+    overige kolommen (bv. floats) als JSON. De store houdt de rijen toch als dicts in het
+    geheugen, dus alles wordt in één keer ingelezen; de int-kolommen gaan als arrays direct
+    naar het frame. Elke snapshot krijgt een eigen map; `actueel.json` wordt pas daarna
+    atomair omgezet, zodat een lezer nooit een half geschreven snapshot ziet.
+    """
+
+    INT_KOLOMMEN = ("id",) + INT_KOLOMMEN
+
+    def __init__(self, pad: str):
+        self.pad = pad
+        self.schrijf_lock = threading.Lock()
+
+    def schrijf(self, rows: List[Dict[str, Any]], watermark: Optional[str]):
+        with self.schrijf_lock:
+            os.makedirs(self.pad, exist_ok=True)
+            naam = f"snap-{time.time_ns()}"
+            doel = os.path.join(self.pad, naam)
+            os.makedirs(doel)
+            sleutels = {k for r in rows for k in r}
+            tekst = sorted(k for k in sleutels - set(self.INT_KOLOMMEN)
+                           if all(isinstance(r.get(k), (str, type(None))) for r in rows))
+            for k in self.INT_KOLOMMEN:
+                np.save(os.path.join(doel, f"{k}.npy"),
+                        np.array([_INT_NULL if r.get(k) is None else r[k] for r in rows], dtype=np.int64))
+            for k in tekst:
+                waarden = [r.get(k) for r in rows]
+                np.save(os.path.join(doel, f"{k}.null.npy"), np.array([w is None for w in waarden], dtype=bool))
+                np.save(os.path.join(doel, f"{k}.off.npy"), np.cumsum([0] + [len(w or "") for w in waarden], dtype=np.int64))
+                with open(os.path.join(doel, f"{k}.txt"), "wb") as f:
+                    f.write("".join(w or "" for w in waarden).encode("utf-8"))
+            overig = sorted(sleutels - set(self.INT_KOLOMMEN) - set(tekst))
+            with open(os.path.join(doel, "overig.json"), "w", encoding="utf-8") as f:
+                json.dump({k: [r.get(k) for r in rows] for k in overig}, f, default=str)
+            meta = {"map": naam, "rijen": len(rows), "watermark": watermark, "tekst": tekst, "geschreven": time.time()}
+            tmp = os.path.join(self.pad, f"actueel.json.{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f: json.dump(meta, f)
+            os.replace(tmp, os.path.join(self.pad, "actueel.json"))
+            # Alleen oude mappen opruimen: een ander proces met dezelfde SNAPSHOT_DIR kan op dit
+            # moment nog in een recente map schrijven (de lock geldt alleen binnen dit proces).
+            grens = time.time() - SNAPSHOT_OPRUIM_SEC
+            for oud in os.listdir(self.pad):
+                pad = os.path.join(self.pad, oud)
+                try:
+                    if oud.startswith("snap-") and oud != naam and os.path.getmtime(pad) < grens:
+                        shutil.rmtree(pad, ignore_errors=True)
+                except OSError:
+                    pass  # al door een ander proces opgeruimd
+
+    def lees(self) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any], Optional[str]]]:
+        """(rijen, kolommen, watermark), of None als er (nog) geen leesbare snapshot is.
+        In `kolommen` staan de int-kolommen als int64-array met _INT_NULL voor ontbrekend."""
+        try:
+            with open(os.path.join(self.pad, "actueel.json"), encoding="utf-8") as f: meta = json.load(f)
+            doel = os.path.join(self.pad, meta["map"])
+            arrays = {k: np.load(os.path.join(doel, f"{k}.npy")) for k in self.INT_KOLOMMEN}
+            kolommen: Dict[str, Any] = {k: [None if v == _INT_NULL else v for v in a.tolist()] for k, a in arrays.items()}
+            for k in meta["tekst"]:
+                with open(os.path.join(doel, f"{k}.txt"), "rb") as f: blob = f.read().decode("utf-8")
+                off = np.load(os.path.join(doel, f"{k}.off.npy")).tolist()
+                null = np.load(os.path.join(doel, f"{k}.null.npy")).tolist()
+                kolommen[k] = [None if n else blob[a:b] for a, b, n in zip(off, off[1:], null)]
+            pad_overig = os.path.join(doel, "overig.json")
+            if os.path.exists(pad_overig):
+                with open(pad_overig, encoding="utf-8") as f: kolommen.update(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+        namen = list(kolommen)
+        rows = [dict(zip(namen, waarden)) for waarden in zip(*kolommen.values())]
+        if len(rows) != meta["rijen"] or not set(DB_KOLOMMEN) <= set(kolommen): return None
+        return rows, {**kolommen, **arrays}, meta["watermark"]
+
+class InventoryStore:
+    """Proces-brede kopie van glas_voorraad, gedeeld door alle sessies.
+
+    Mutaties worden per id in het geheugen gepatcht; wijzigingen van andere
+    sessies komen binnen via een delta-fetch op updated_at. Een volledige
+    herlaadbeurt gebeurt alleen op verzoek (of als updated_at ontbreekt).
+    Bij een koude start komt de eerste versie uit de snapshot op schijf, als die er is.
+    """
+
+    def __init__(self, repo: GlasVoorraadRepository, snapshot: Optional[VoorraadSnapshot] = None):
+        self.repo = repo
+        self.snapshot = snapshot
+        self._snapshot_versie = 0
+        self._snapshot_tijd = 0.0
+        self.lock = threading.RLock()
+        self._laad_lock = threading.RLock()  # koude start en reload: één tegelijk, zonder de leeslock te houden
+        self.rows: Dict[int, Dict[str, Any]] = {}
+        self.version = 0
+        self.watermark: Optional[str] = None
+        self.loaded_at = 0.0
+        self.synced_at = 0.0
+        self.delta_supported = True
+        self._scan_bezig = False
+        self._sorted_ids: Optional[List[int]] = None
+        self._search_cache: "OrderedDict[Any, List[int]]" = OrderedDict()
+        self._dim_index: Optional[DimensionIndex] = None
+        self._frame: Optional[pd.DataFrame] = None
+        # Zoekindex en locatie-overzicht pas bij het eerste gebruik; daarna incrementeel.
+        self._index: Optional[SearchIndex] = None
+        self._overzicht: Optional[LocatieOverzicht] = None
+        self._warm_klaar = threading.Event()  # gezet zolang er geen achtergrondbouw loopt
+        self._warm_klaar.set()
+
+    def _bump(self):
+        self.version += 1
+        self._sorted_ids = None
+        self._search_cache = OrderedDict()
+        self._dim_index = None
+
+    def _advance_watermark(self, records: List[Dict[str, Any]]):
+        stamps = [r["updated_at"] for r in records if r.get("updated_at")]
+        if stamps and (self.watermark is None or max(stamps) > self.watermark):
+            self.watermark = max(stamps)
+
+    def ensure_loaded(self):
+        """Eenmalige koude start; gelijktijdige sessies wachten op de eerste in plaats van elk een eigen reload."""
+        if self.loaded_at: return
+        with self._laad_lock:
+            if not self.loaded_at: self._koude_start()
+
+    def _koude_start(self):
+        """Eerst de snapshot van schijf; de delta-sync tegen de database loopt op de achtergrond."""
+        snap = self.snapshot.lees() if self.snapshot else None
+        if snap is None:
+            return self.reload()
+        data, kolommen, watermark = snap
+        with self.lock:
+            self._vul(data)
+            self._frame = bouw_frame_kolommen(kolommen)  # kolommen liggen al klaar: geen omweg via de rijen
+            self.watermark = watermark
+            self.loaded_at = self.synced_at = time.time()
+            self._snapshot_versie = self.version
+            uit_snapshot = list(self.rows)
+
+        def verzoenen():
+            if not watermark: return self.reload()
+            self._sync(force=True)
+            # De snapshot kan oud zijn: verwijderingen sindsdien niet alleen via het aantal afleiden.
+            # Alleen ids uit de snapshot zelf; wat deze sessie intussen toevoegde blijft staan.
+            self._scan_en_prune(set(uit_snapshot))
+        # Eerst de index uit de snapshot (lokaal werk), dan pas het verzoenen met de database:
+        # de eerste zoekopdracht wacht zo nooit op netwerk-round-trips.
+        self._start_warm(daarna=verzoenen)
+
+    def _start_warm(self, daarna=None):
+        self._warm_klaar.clear()
+
+        def run():
+            try: self._warm_op()
+            finally: self._warm_klaar.set()
+            if daarna: daarna()
+        threading.Thread(target=run, daemon=True, name="store-warm").start()
+
+    def _warm_op(self):
+        """Bouwt zoekindex en locatie-overzicht buiten de lock; ze worden alleen geplaatst
+        als de voorraad intussen niet veranderde (anders later alsnog bij het eerste gebruik)."""
+        with self.lock:
+            versie, rows = self.version, list(self.rows.values())
+        index, overzicht = SearchIndex(), LocatieOverzicht()
+        index.build(rows)
+        overzicht.build(rows)
+        with self.lock:
+            if self.version != versie: return
+            if self._index is None: self._index = index
+            if self._overzicht is None: self._overzicht = overzicht
+
+    def _vul(self, data: List[Dict[str, Any]]):
+        self.rows = {r["id"]: r for r in data}
+        self._index = self._overzicht = None
+        self._frame = None
+        self._bump()
+
+    def _wacht_op_warm(self):
+        """Liever even wachten op de achtergrondbouw dan hetzelfde werk dubbel doen;
+        dat is alleen de lokale indexbouw, nooit een sync met de database."""
+        self._warm_klaar.wait()
+
+    def _zoekindex(self) -> SearchIndex:
+        with self.lock:
+            if self._index is None:
+                self._index = SearchIndex()
+                self._index.build(list(self.rows.values()))
+            return self._index
+
+    def _bewaar_snapshot(self, direct: bool = False):
+        """Schrijft de snapshot op de achtergrond weg als er sinds de vorige iets is veranderd."""
+        if not self.snapshot or self.version == self._snapshot_versie: return
+        if not direct and time.time() - self._snapshot_tijd < SNAPSHOT_INTERVAL_SEC: return
+        with self.lock:
+            rows, watermark = list(self.rows.values()), self.watermark
+            self._snapshot_versie, self._snapshot_tijd = self.version, time.time()
+        threading.Thread(target=self.snapshot.schrijf, args=(rows, watermark), daemon=True, name="snapshot-schrijf").start()
+
+    @contextmanager
+    def _meet(self, operatie: str, hit: bool):
+        if self.repo.metrics is None:
+            yield
+            return
+        with self.repo.metrics.meet(operatie, cache="hit" if hit else "miss"):
+            yield
+
+    def reload(self):
+        with self._laad_lock:
+            self._reload()
+
+    def _reload(self):
+        data, _ = self.repo.get_all_data("")
+        with self.lock:
+            self._vul(data)
+            self.watermark = None
+            self._advance_watermark(data)
+            self.loaded_at = self.synced_at = time.time()
+        self._bewaar_snapshot(direct=True)
+        self._start_warm()
+
+    def sync(self, force: bool = False):
+        """Haalt wijzigingen van andere sessies op, hooguit eens per SYNC_INTERVAL_SEC."""
+        vers = self.loaded_at and not force and time.time() - self.synced_at < SYNC_INTERVAL_SEC
+        with self._meet("store.sync", bool(vers)):
+            self._sync(force)
+
+    def _sync(self, force: bool):
+        if not self.loaded_at:
+            return self.ensure_loaded()
+        self._bewaar_snapshot()
+        nu = time.time()
+        if not force and nu - self.synced_at < SYNC_INTERVAL_SEC:
+            return
+        self.synced_at = nu
+        if not self.delta_supported or self.watermark is None:
+            if nu - self.loaded_at > FULL_RELOAD_TTL_SEC: self.reload()
+            return
+        since = (pd.Timestamp(self.watermark) - pd.Timedelta(seconds=SYNC_OVERLAP_SEC)).isoformat()
+        # Delta en telling zijn onafhankelijk: parallel, met timeout.
+        res, fouten = self.repo.gather({"delta": (functools.partial(self.repo.get_changed_since, since), None),
+                                        "telling": (functools.partial(self.repo.count_matching, ""), None)})
+        if fouten:
+            # Alleen zonder updated_at-kolom heeft delta-sync geen zin; een netwerkfout of
+            # timeout probeert het na SYNC_INTERVAL_SEC gewoon opnieuw.
+            if any("updated_at" in f for f in fouten.values()): self.delta_supported = False
+            return
+        changed, server_count = res["delta"], res["telling"]
+        with self.lock:
+            if changed:
+                self.apply_upsert(changed)
+                self._advance_watermark(changed)
+            if server_count == len(self.rows) or self._scan_bezig: return
+            self._scan_bezig = True
+            voor = set(self.rows)
+        # Telling wijkt af: ergens is verwijderd. De id-scan kost N / FETCH_BATCH round-trips en
+        # loopt daarom op de achtergrond, net als het verzoenen na een koude start.
+        threading.Thread(target=self._scan_en_prune, args=(voor,), daemon=True, name="store-prune").start()
+
+    def _scan_en_prune(self, kandidaten: set):
+        """Verwijdert alleen ids die er vóór de scan al waren; wat intussen is toegevoegd blijft staan."""
+        self._scan_bezig = True
         try:
-            vijf_min_geleden = (datetime.now(pytz.utc) - pd.Timedelta(minutes=5)).isoformat()
-            res = self.client.table("active_sessions").select("username").gt("last_seen", vijf_min_geleden).execute()
-            return [r['username'].split('@')[0].capitalize() for r in res.data]
-        except: return []
+            res, fouten = self.repo.gather({"ids": (self.repo.get_all_ids, None)}, timeout=SCAN_TIMEOUT_SEC)
+            if fouten: return
+            server_ids = set(res["ids"])
+            weg = [rid for rid in kandidaten if rid not in server_ids]
+            if weg: self.apply_delete(weg)
+        finally:
+            self._scan_bezig = False
+
+    def apply_upsert(self, records: List[Dict[str, Any]]):
+        if not records: return
+        with self.lock:
+            gewijzigd, nieuw = [], False
+            for r in records:
+                if r.get("id") is None: continue
+                oud = self.rows.get(r["id"])
+                if oud is not None and all(oud.get(k) == v for k, v in r.items()): continue
+                nieuw = nieuw or oud is None
+                self.rows[r["id"]] = row = {**(oud or {}), **r}
+                if self._index is not None: self._index.add(row)
+                if self._overzicht is not None:
+                    if oud is not None: self._overzicht.remove(oud)
+                    self._overzicht.add(row)
+                gewijzigd.append(r["id"])
+            if not gewijzigd: return
+            self._patch_frame(gewijzigd, nieuw)
+            self._bump()
+
+    def apply_delete(self, ids: List[int]):
+        with self.lock:
+            for rid in ids:
+                oud = self.rows.pop(rid, None)
+                if oud is None: continue
+                if self._index is not None: self._index.remove(rid)
+                if self._overzicht is not None: self._overzicht.remove(oud)
+            if self._frame is not None:
+                self._frame = self._frame.drop(index=ids, errors="ignore")
+            self._bump()
+
+    def _patch_frame(self, ids: List[int], nieuw: bool):
+        if self._frame is None: return
+        if nieuw:
+            self._frame = None; return
+        try:
+            for c in DB_KOLOMMEN[1:]:
+                self._frame.loc[ids, c] = [self.rows[i].get(c) for i in ids]
+        except (TypeError, ValueError, KeyError):
+            self._frame = None
+
+    def frame(self) -> pd.DataFrame:
+        """Getypeerd frame van de hele voorraad; één keer gebouwd, daarna gepatcht."""
+        with self.lock, self._meet("store.frame", self._frame is not None):
+            if self._frame is None:
+                self._frame = bouw_frame(list(self.rows.values()))
+            return self._frame
+
+    def frame_rows(self, ids: List[int]) -> pd.DataFrame:
+        with self.lock:
+            return self.frame().loc[[i for i in ids if i in self.rows]]
+
+    def locatie_overzicht(self) -> pd.DataFrame:
+        if self._overzicht is None: self._wacht_op_warm()
+        with self.lock:
+            if self._overzicht is None:
+                self._overzicht = LocatieOverzicht()
+                self._overzicht.build(self.rows.values())
+            return self._overzicht.tabel()
+
+    def get(self, ids: List[int]) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [self.rows[i] for i in ids if i in self.rows]
+
+    def sorted_ids(self) -> List[int]:
+        with self.lock:
+            if self._sorted_ids is None:
+                self._sorted_ids = sorted(self.rows)
+            return self._sorted_ids
+
+    def search(self, zoekterm: str) -> List[int]:
+        """Zelfde semantiek als de ilike-filter, maar lokaal via de n-gram index."""
+        if not zoekterm: return self.sorted_ids()
+        if self._index is None: self._wacht_op_warm()  # vóór de lock: de bouwer heeft die ook nodig
+        with self.lock, self._meet("store.search", zoekterm in self._search_cache):
+            return self._gecached(zoekterm, lambda: self._zoekindex().query(zoekterm))
+
+    def search_maat(self, maat: MaatZoek) -> List[int]:
+        if not maat.actief: return self.sorted_ids()
+        with self.lock, self._meet("store.search_maat", maat in self._search_cache):
+            if maat not in self._search_cache and self._dim_index is None:
+                self._dim_index = DimensionIndex(self.rows.values())
+            return self._gecached(maat, lambda: self._dim_index.query(maat))
+
+    def _gecached(self, sleutel, bereken) -> List[int]:
+        """LRU op zoekresultaten; de aanroeper houdt de lock vast."""
+        cache = self._search_cache
+        if sleutel in cache:
+            cache.move_to_end(sleutel)
+        else:
+            cache[sleutel] = bereken()
+            while len(cache) > ZOEK_CACHE_MAX: cache.popitem(last=False)
+        return cache[sleutel]
+
+class PresenceTracker:
+    """Aanwezigheid via een achtergrond-heartbeat in plaats van in elke rerun.
+
+    `touch` registreert alleen een tijdstip in het geheugen. De worker schrijft
+    hooguit eens per PRESENCE_INTERVAL_SEC per gebruiker naar active_sessions
+    en ververst de online-lijst elke ONLINE_TTL_SEC voor alle sessies.
+    """
+
+    def __init__(self, repo: GlasVoorraadRepository):
+        self.repo = repo
+        self.lock = threading.Lock()
+        self.gezien: Dict[str, float] = {}
+        self.geschreven: Dict[str, float] = {}
+        self.online: List[str] = []
+        self.online_at = 0.0
+        self._wake = threading.Event()
+        threading.Thread(target=self._run, name="presence-heartbeat", daemon=True).start()
+
+    def touch(self, username: str):
+        if not username: return
+        with self.lock:
+            self.gezien[username] = time.time()
+            if username not in self.geschreven: self._wake.set()
+
+    def online_users(self) -> List[str]:
+        return self.online
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=ONLINE_TTL_SEC)
+            self._wake.clear()
+            try: self._tick()
+            except Exception: pass
+
+    def _tick(self):
+        nu = time.time()
+        with self.lock:
+            due = [u for u, t in self.gezien.items()
+                   if t > self.geschreven.get(u, 0) and nu - self.geschreven.get(u, 0) >= PRESENCE_INTERVAL_SEC]
+            for u in due: self.geschreven[u] = nu
+        for u in due: self.repo.update_online_status(u)
+        if due or nu - self.online_at >= ONLINE_TTL_SEC:
+            self.online = self.repo.get_online_users()
+            self.online_at = nu
 
 # =============================================================================
-# 3. SERVICE LAAG
+# 5. SERVICE LAAG
 # =============================================================================
 
+@dataclass
+class ImportResultaat:
+    gewijzigd: int = 0
+    nieuw: int = 0
+    ongewijzigd: int = 0
+    fouten: List[Dict[str, Any]] = field(default_factory=list)
+
+_INT_NULL = -(2 ** 63)
+
+def _encodeer_kolom(waarden: List[Any]) -> tuple:
+    """Kolom compact opslaan: ints als array('q'), overige waarden dictionary-encoded."""
+    if all(v is None or (isinstance(v, int) and not isinstance(v, bool)) for v in waarden):
+        return ("int", array("q", [_INT_NULL if v is None else v for v in waarden]))
+    uniek: Dict[Any, int] = {}
+    codes = array("l", [uniek.setdefault(v, len(uniek)) for v in waarden])
+    return ("dict", list(uniek), codes)
+
+def _decodeer_kolom(kolom: tuple) -> List[Any]:
+    if kolom[0] == "int":
+        return [None if v == _INT_NULL else v for v in kolom[1]]
+    return [kolom[1][c] for c in kolom[2]]
+
+@dataclass
+class UndoStap:
+    tijd: str
+    label: str
+    ids: array
+    kolommen: Dict[str, tuple]
+
+    @property
+    def nbytes(self) -> int:
+        totaal = self.ids.itemsize * len(self.ids)
+        for kol in self.kolommen.values():
+            totaal += kol[-1].itemsize * len(kol[-1])
+            if kol[0] == "dict": totaal += sum(sys.getsizeof(v) for v in kol[1])
+        return totaal
+
+    def records(self) -> List[Dict[str, Any]]:
+        kolommen = {k: _decodeer_kolom(v) for k, v in self.kolommen.items()}
+        return [{"id": rid, **{k: vals[i] for k, vals in kolommen.items()}} for i, rid in enumerate(self.ids)]
+
+class UndoLog:
+    """Begrensde undo-historie die per stap alleen de oude waarden van de gewijzigde kolommen bewaart.
+
+    Bij verwijderen worden alle kolommen bewaard zodat de rij terug kan komen.
+    Met UNDO_DIR gezet wordt de log per gebruiker als JSON op schijf bijgehouden.
+    """
+
+    def __init__(self, pad: Optional[str] = None, max_bytes: int = UNDO_MAX_BYTES, max_stappen: int = UNDO_MAX_STAPPEN):
+        self.pad, self.max_bytes, self.max_stappen = pad, max_bytes, max_stappen
+        self.stappen: List[UndoStap] = []
+        if pad and os.path.exists(pad):
+            try: self._laad()
+            except (OSError, ValueError, KeyError): self.stappen = []
+
+    @classmethod
+    def voor_gebruiker(cls, gebruikersnaam: str) -> "UndoLog":
+        if not UNDO_DIR or not gebruikersnaam: return cls()
+        os.makedirs(UNDO_DIR, exist_ok=True)
+        veilig = re.sub(r"[^A-Za-z0-9_.-]", "_", gebruikersnaam)
+        return cls(os.path.join(UNDO_DIR, f"{veilig}.json"))
+
+    def __len__(self) -> int:
+        return len(self.stappen)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(s.nbytes for s in self.stappen)
+
+    def laatste(self) -> Optional[UndoStap]:
+        return self.stappen[-1] if self.stappen else None
+
+    def push(self, records: List[Dict[str, Any]], kolommen: List[str], label: str = ""):
+        kolommen = [k for k in kolommen if k not in ("id", "Selecteren", "updated_at")]
+        if not records or not kolommen: return
+        stap = UndoStap(
+            tijd=datetime.now(AMSTERDAM_TZ).strftime("%H:%M:%S"), label=label,
+            ids=array("q", [r["id"] for r in records]),
+            kolommen={k: _encodeer_kolom([r.get(k) for r in records]) for k in kolommen},
+        )
+        self.stappen.append(stap)
+        while len(self.stappen) > self.max_stappen or (len(self.stappen) > 1 and self.nbytes > self.max_bytes):
+            self.stappen.pop(0)
+        self._bewaar()
+
+    def pop(self) -> List[Dict[str, Any]]:
+        if not self.stappen: return []
+        records = self.stappen.pop().records()
+        self._bewaar()
+        return records
+
+    def _bewaar(self):
+        if not self.pad: return
+        data = [{"tijd": s.tijd, "label": s.label, "ids": s.ids.tolist(),
+                 "kolommen": {k: [v[0], *(x if isinstance(x, list) else x.tolist() for x in v[1:])] for k, v in s.kolommen.items()}}
+                for s in self.stappen]
+        tmp = f"{self.pad}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f: json.dump(data, f)
+        os.replace(tmp, self.pad)
+
+    def _laad(self):
+        with open(self.pad, encoding="utf-8") as f: data = json.load(f)
+        for s in data:
+            kolommen = {}
+            for k, v in s["kolommen"].items():
+                kolommen[k] = ("int", array("q", v[1])) if v[0] == "int" else ("dict", v[1], array("l", v[2]))
+            self.stappen.append(UndoStap(s["tijd"], s["label"], array("q", s["ids"]), kolommen))
+
+def _normaliseer_kolom(naam: Any) -> str:
+    kolom = str(naam).lower().strip().replace(' ', '_')
+    return "order_nummer" if kolom == "order" else kolom
+
+def _coerce_import_rij(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Zet één Excel-rij om naar DB-types; gooit ValueError met een leesbare melding."""
+    rec = {}
+    for col, val in raw.items():
+        if isinstance(val, str): val = val.strip() or None
+        if val is None:
+            rec[col] = None
+        elif col in ("id", "aantal", "breedte", "hoogte"):
+            try: getal = float(val)
+            except (TypeError, ValueError): raise ValueError(f"{col}: '{val}' is geen getal")
+            if not getal.is_integer() or getal < 0: raise ValueError(f"{col}: '{val}' is geen geheel getal ≥ 0")
+            rec[col] = int(getal)
+        elif col == "locatie":
+            rec[col] = str(val).upper()
+            if rec[col] not in LOCATIE_OPTIES: raise ValueError(f"locatie: '{val}' bestaat niet")
+        else:
+            rec[col] = str(int(val)) if isinstance(val, float) and val.is_integer() else str(val)
+    return rec
+
+def lees_excel_rijen(bestand):
+    """Streamt (rijnummer, laatste rij, dict) uit het eerste werkblad via openpyxl read-only."""
+    from openpyxl import load_workbook
+    wb = load_workbook(bestand, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        rijen = ws.iter_rows(values_only=True)
+        kolommen = [_normaliseer_kolom(c) for c in next(rijen, ())]
+        for nr, waarden in enumerate(rijen, start=2):
+            if all(v is None for v in waarden): continue
+            yield nr, ws.max_row, {k: v for k, v in zip(kolommen, waarden) if k in DB_KOLOMMEN}
+    finally:
+        wb.close()
+
+
+def export_formaten() -> List[str]:
+    """Parquet alleen als pyarrow aanwezig is; het is geen vaste dependency."""
+    return [f for f in EXPORT_FORMATEN if f != "parquet" or importlib.util.find_spec("pyarrow")]
+
+def schrijf_export(paginas, formaat: str) -> bytes:
+    """Schrijft pagina voor pagina naar een tijdelijk bestand; er staat nooit meer dan één
+    pagina rijen in het geheugen. st.download_button accepteert alleen bytes of een gewone
+    file-handle en leest die toch volledig in, dus het resultaat gaat als bytes terug."""
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as uit:
+        if formaat == "csv":
+            tekst = io.TextIOWrapper(uit, encoding="utf-8-sig", newline="")
+            schrijver = csv.DictWriter(tekst, fieldnames=DB_KOLOMMEN, delimiter=";", extrasaction="ignore")
+            schrijver.writeheader()
+            for page in paginas: schrijver.writerows(page)
+            tekst.flush(); tekst.detach()
+        elif formaat == "xlsx":
+            from openpyxl import Workbook
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet("Voorraad")
+            ws.append(DB_KOLOMMEN)
+            for page in paginas:
+                for r in page: ws.append([r.get(k) for k in DB_KOLOMMEN])
+            wb.save(uit)
+        elif formaat == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pa.schema([(k, pa.int64() if k == "id" else pa.int32() if k in INT_KOLOMMEN else pa.string()) for k in DB_KOLOMMEN])
+            with pq.ParquetWriter(uit, schema) as schrijver:
+                for page in paginas: schrijver.write_table(pa.Table.from_pylist(page, schema=schema))
+        else:
+            raise ValueError(f"Onbekend exportformaat: {formaat}")
+        uit.seek(0)
+        return uit.read()
+
 class VoorraadService:
-    def __init__(self, repo: GlasVoorraadRepository):
+    def __init__(self, repo: GlasVoorraadRepository, store: InventoryStore):
         self.repo = repo
+        self.store = store
 
-    def laad_data(self, zoekterm: str, page: int) -> Tuple[pd.DataFrame, int]:
-        @st.cache_data(ttl=600)
-        def _cached_fetch(zoek: str):
-            return self.repo.get_all_data(zoek)
-        
-        data, count = _cached_fetch(zoekterm)
-        kolommen = ["Selecteren", "locatie", "aantal", "breedte", "hoogte", "order_nummer", "omschrijving", "id"]
-        if not data: return pd.DataFrame(columns=kolommen), 0
-        df = pd.DataFrame(data)
-        df["Selecteren"] = df["id"].apply(lambda x: x in st.session_state.app_state.selected_ids)
-        for col in kolommen:
-            if col not in df.columns: df[col] = None
-        return df[kolommen], count
-
-    def trigger_mutation(self):
-        st.cache_data.clear()
-
-    def push_undo_state(self, affected_ids: List[int]):
-        records = self.repo.get_by_ids(affected_ids)
-        if not records: return
-        nu = datetime.now(AMSTERDAM_TZ).strftime("%H:%M:%S")
-        st.session_state.app_state.undo_stack.append({"data": records, "tijd": nu})
-        if len(st.session_state.app_state.undo_stack) > 10:
-            st.session_state.app_state.undo_stack.pop(0)
+    def _zoek_ids(self, zoekterm: str, maat: Optional[MaatZoek]) -> List[int]:
+        return self.store.search_maat(maat) if maat else self.store.search(zoekterm)
+
+    def laad_data(self, zoekterm: str, page: int, maat: Optional[MaatZoek] = None) -> Tuple[pd.DataFrame, int]:
+        self.store.sync()
+        ids = self._zoek_ids(zoekterm, maat)
+        pagina = ids[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+        with self.store.lock:
+            df = self.store.frame_rows(pagina).reset_index(drop=True)
+            # De store vervangt rij-dicts bij elke wijziging, dus dit zijn vaste kopieën van wat de
+            # gebruiker ziet (incl. updated_at): een latere wijziging door een ander wordt geen nieuwe basis.
+            st.session_state.app_state.getoond = {r["id"]: r for r in self.store.get(pagina)}
+        # Locatie is in de editor vrije tekst: een categorical zou bij een onbekende waarde een TypeError geven.
+        df["locatie"] = df["locatie"].astype("string")
+        df.insert(0, "Selecteren", df["id"].isin(st.session_state.app_state.selectie.ids))
+        return st.session_state.app_state.edit_buffer.overlay(df[EDITOR_KOLOMMEN]), len(ids)
+
+    def matching_ids(self, zoekterm: str, maat: Optional[MaatZoek] = None) -> List[int]:
+        self.store.sync()
+        return self._zoek_ids(zoekterm, maat)
+
+    def _alles_of_niets(self, fout: BatchFout, herstel):
+        """Draait de gelukte batches terug. Lukt ook dat niet, dan wordt de store
+        ververst en meldt de fout hoeveel ruiten wél gewijzigd zijn."""
+        try:
+            if fout.gelukt: herstel(fout.gelukt)
+        except Exception as e:
+            self.store.sync(force=True)
+            raise BatchFout(fout.operatie, fout.gelukt, f"{fout.oorzaak}; terugdraaien mislukt ({e}), "
+                                                        f"{len(fout.gelukt)} ruiten zijn wél gewijzigd") from e
+        raise BatchFout(fout.operatie, [], f"{fout.oorzaak}; er is niets gewijzigd", teruggedraaid=True) from fout
+
+    def verwijder(self, ids: List[int], voortgang=None):
+        try:
+            self.repo.delete_many(ids, voortgang)
+        except BatchFout as e:
+            # De store heeft de verwijderde rijen nog: die gaan volledig terug.
+            self._alles_of_niets(e, lambda gelukt: self.repo.bulk_update_fields(self.store.get(gelukt)))
+        self.store.apply_delete(ids)
+
+    def verplaats(self, ids: List[int], nieuwe_locatie: str, voortgang=None):
+        vorige = defaultdict(list)
+        for r in self.store.get(ids): vorige[r.get("locatie")].append(r["id"])
+        try:
+            data = self.repo.bulk_update_location(ids, nieuwe_locatie, voortgang)
+        except BatchFout as e:
+            def herstel(gelukt):
+                gelukt = set(gelukt)
+                for loc, groep in vorige.items():
+                    terug = [i for i in groep if i in gelukt]
+                    if terug: self.repo.bulk_update_location(terug, loc)
+            self._alles_of_niets(e, herstel)
+        self.store.apply_upsert(data)
+
+    def update_velden(self, updates: List[Dict[str, Any]], voortgang=None):
+        vorige = {r["id"]: dict(r) for r in self.store.get([u["id"] for u in updates if u.get("id") is not None])}
+        try:
+            data = self.repo.bulk_update_fields(updates, voortgang)
+        except BatchFout as e:
+            def herstel(gelukt):
+                terug = [vorige[u["id"]] for u in gelukt if u.get("id") in vorige]
+                nieuw = [u["id"] for u in gelukt if u.get("id") is not None and u["id"] not in vorige]
+                if terug: self.repo.bulk_update_fields(terug)
+                if nieuw: self.repo.delete_many(nieuw)
+            self._alles_of_niets(e, herstel)
+        self.store.apply_upsert(data)
+
+    def sla_edits_op(self, buffer: EditBuffer, voortgang=None) -> Tuple[int, List[int]]:
+        """Eén batch-upsert voor alle gebufferde wijzigingen. Rijen waarvan updated_at sinds
+        de eerste wijziging is veranderd (of die weg zijn) worden overgeslagen en teruggemeld."""
+        if not buffer.wijzigingen: return 0, []
+        self.store.sync(force=True)
+        # Verwijderingen komen pas via de achtergrond-scan in de store: hier direct navragen,
+        # anders zet de upsert een intussen verwijderde ruit als halve rij terug.
+        bestaand = self.repo.bestaande_ids(list(buffer.wijzigingen))
+        huidig = {r["id"]: r for r in self.store.get(list(buffer.wijzigingen)) if r["id"] in bestaand}
+        conflicten = [rid for rid in buffer.wijzigingen
+                      if rid not in huidig or huidig[rid].get("updated_at") != buffer.basis[rid].get("updated_at")]
+        ids = [rid for rid in buffer.wijzigingen if rid not in conflicten]
+        kolommen = sorted({k for rid in ids for k in buffer.wijzigingen[rid]})
+        # Alle records dezelfde sleutels (eis van de bulk-upsert); niet-gewijzigde kolommen krijgen hun huidige waarde.
+        records = [{"id": rid, **{k: huidig[rid].get(k) for k in kolommen}, **buffer.wijzigingen[rid]} for rid in ids]
+        if records:
+            self.push_undo_snapshot([buffer.basis[rid] for rid in ids], kolommen, "Bewerkt")
+            self.update_velden(records, voortgang)
+        buffer.clear()
+        return len(records), conflicten
+
+    def voeg_toe(self, record: Dict[str, Any]):
+        self.store.apply_upsert(self.repo.insert_one(record).data)
+
+    def exporteer(self, zoekterm: str, formaat: str):
+        """Rechtstreeks uit de database, in keyset-pagina's; zoekterm werkt als de ilike-zoekfilter."""
+        return schrijf_export(self.repo.iter_pages(zoekterm), formaat)
+
+    def volledig_verversen(self):
+        self.store.reload()
+
+    def importeer_excel(self, bestand, voortgang=None) -> ImportResultaat:
+        """Import in begrensde batches; alleen echt gewijzigde rijen gaan naar de DB en de undo.
+
+        Elke batch wordt los doorgevoerd. Faalt een latere batch, dan meldt de fout hoeveel
+        rijen al wél in de database staan; alleen die komen in de undo-stap.
+        """
+        res, upserts, inserts = ImportResultaat(), [], []
+        # Per gewijzigde rij alleen id en de oude waarden van de kolommen die de import raakt.
+        wachtend, gedaan, doorgevoerd = [], [], 0
+
+        def flush():
+            nonlocal doorgevoerd
+            if upserts:
+                self.update_velden(upserts)
+                doorgevoerd += len(upserts); gedaan.extend(wachtend)
+            if inserts:
+                self.store.apply_upsert(self.repo.insert_many(inserts))
+                doorgevoerd += len(inserts)
+            upserts.clear(); inserts.clear(); wachtend.clear()
+
+        self.store.sync()
+        try:
+            for gelezen, (nr, laatste, raw) in enumerate(lees_excel_rijen(bestand), 1):
+                # Voortgang op gelezen rijen, ook als er (nog) niets naar de DB gaat.
+                if voortgang and gelezen % IMPORT_VOORTGANG_RIJEN == 0: voortgang(nr, laatste)
+                try:
+                    rec = _coerce_import_rij(raw)
+                except ValueError as e:
+                    res.fouten.append({"rij": nr, "fout": str(e)}); continue
+                rid = rec.get("id")
+                if rid is None:
+                    rec.pop("id", None); inserts.append(rec); res.nieuw += 1
+                else:
+                    huidig = self.store.rows.get(rid)
+                    if huidig is None:
+                        upserts.append(rec); res.nieuw += 1
+                    elif any(huidig.get(k) != v for k, v in rec.items()):
+                        wachtend.append({"id": rid, **{k: huidig.get(k) for k, v in rec.items() if huidig.get(k) != v}})
+                        upserts.append(rec); res.gewijzigd += 1
+                    else:
+                        res.ongewijzigd += 1
+                if len(upserts) + len(inserts) >= IMPORT_BATCH: flush()
+            flush()
+        except Exception as e:
+            if not doorgevoerd: raise
+            oorzaak = e.__cause__ if isinstance(e, BatchFout) and e.teruggedraaid else e
+            raise BatchFout("import", [], f"{oorzaak}; {doorgevoerd} rijen uit eerdere batches zijn wél geïmporteerd "
+                                          f"(terug te draaien met undo), de rest niet") from e
+        finally:
+            # Kolommen die een rij niet raakte zijn door de import niet veranderd: hun huidige waarde is de oude.
+            kolommen = sorted({k for r in gedaan for k in r if k != "id"})
+            self.push_undo_snapshot([{**self.store.rows.get(r["id"], {}), **r} for r in gedaan], kolommen, "Import")
+        return res
+
+    def push_undo_state(self, affected_ids: List[int], kolommen: Optional[List[str]] = None, label: str = ""):
+        """Snapshot uit de in-memory store; kolommen=None bewaart de hele rij (voor verwijderen)."""
+        records = self.store.get(affected_ids)
+        self.push_undo_snapshot(records, kolommen or sorted({k for r in records for k in r}), label)
+
+    def push_undo_snapshot(self, records: List[Dict[str, Any]], kolommen: List[str], label: str = ""):
+        st.session_state.app_state.undo_log.push(records, kolommen, label)
+
+    def undo(self, voortgang=None) -> int:
+        """Pas na een geslaagde (alles-of-niets) update verdwijnt de stap uit de log.
+        Geeft het aantal overgeslagen ruiten terug: bij een stap met alleen enkele kolommen
+        zou de upsert intussen verwijderde ruiten als halve rij opnieuw invoegen."""
+        log = st.session_state.app_state.undo_log
+        stap = log.laatste()
+        if stap is None: return 0
+        records = stap.records()
+        if not set(DB_KOLOMMEN[1:]) <= set(stap.kolommen):
+            bestaand = self.repo.bestaande_ids([r["id"] for r in records])
+            records = [r for r in records if r["id"] in bestaand]
+        if records: self.update_velden(records, voortgang)
+        log.pop()
+        return len(stap.ids) - len(records)
 
 # =============================================================================
-# 4. UI HELPER FUNCTIES & CACHING
+# 6. UI HELPER FUNCTIES & CACHING
 # =============================================================================
 
 @st.cache_resource
 def init_supabase() -> Client: 
     return create_client(st.secrets["supabase"]["url"], st.secrets["supabase"]["key"])
 
-@st.cache_data
-def get_base64_logo(img_path: str) -> str:
-    if os.path.exists(img_path):
-        with open(img_path, "rb") as f: return base64.b64encode(f.read()).decode()
-    return ""
-
-def render_styling(logo_b64: str):
-    st.markdown(f"""
-        <style>
-        .block-container {{ padding-top: 1rem; padding-bottom: 5rem; }}
-        #MainMenu, footer, header {{visibility: hidden;}}
-        .stApp {{ transition: opacity 0.2s ease-in-out; }}
-        
-        .custom-header {{ 
-            display: flex; align-items: center; gap: 15px; margin-bottom: 30px; 
-        }}
-        .custom-header img {{ height: 55px; width: auto; display: block; }}
-        .custom-header h1 {{ 
-            margin: 0 !important; padding: 0 !important; font-size: 1.85rem !important; 
-            font-weight: 700; display: flex; align-items: center;
-        }}
-        
-        div[data-testid="stTextInput"] > div {{ height: 3.5em !important; }}
-        div.stButton > button {{ border-radius: 8px; font-weight: 600; height: 3.5em !important; width: 100%; }}
-        
-        @media (max-width: 640px) {{
-            .custom-header h1 {{ font-size: 1.4rem !important; }}
-            .custom-header img {{ height: 45px; }}
-        }}
-        </style>
-    """, unsafe_allow_html=True)
-
-def render_header(logo_b64: str):
+@st.cache_resource
+def init_metrics() -> PerfMetrics:
+    return PerfMetrics()
+
+def gemeten(operatie: str):
+    """Decorator voor render-stappen; st.rerun (BaseException) telt niet als fout."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with init_metrics().meet(operatie):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+def is_admin(gebruikersnaam: str) -> bool:
+    try:
+        return gebruikersnaam in st.secrets.get("admin_users", [])
+    except Exception:
+        return False
+
+@st.cache_resource
+def init_thread_pool() -> ThreadPoolExecutor:
+    """Eén pool per proces; als klasse-attribuut zou elke rerun een nieuwe pool starten."""
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="repo")
+
+@st.cache_resource
+def init_mutatie_pool() -> ThreadPoolExecutor:
+    """Aparte pool, zodat gebatchte calls binnen `gather` niet op dezelfde workers wachten."""
+    return ThreadPoolExecutor(max_workers=MUTATIE_WORKERS, thread_name_prefix="mutatie")
+
+def voortgangsbalk(tekst: str):
+    """Callback (klaar, totaal) op een st.progress; pas zichtbaar bij de eerste melding."""
+    balk = None
+    def voortgang(klaar, totaal):
+        nonlocal balk
+        if balk is None: balk = st.progress(0.0, text=tekst)
+        balk.progress(min(klaar / totaal, 1.0) if totaal else 0.0, text=f"{tekst} {klaar}" + (f" van {totaal}" if totaal else ""))
+    return voortgang
+
+@st.cache_resource
+def init_inventory_store(_repo: GlasVoorraadRepository) -> InventoryStore:
+    snapshot = None
+    if SNAPSHOT_DIR:
+        # Per database een eigen map, zodat bv. test en productie elkaars snapshot nooit laden.
+        sleutel = hashlib.sha1(st.secrets["supabase"]["url"].encode()).hexdigest()[:12]
+        snapshot = VoorraadSnapshot(os.path.join(SNAPSHOT_DIR, sleutel))
+    return InventoryStore(_repo, snapshot)
+
+@st.cache_resource
+def init_presence(_repo: GlasVoorraadRepository) -> PresenceTracker:
+    return PresenceTracker(_repo)
+
+def render_styling():
+    # st.html laat geen <link> door, wel <style>: via @import haalt de browser de stylesheet
+    # zelf uit ./static en cachet die, in plaats van de CSS in elke rerun mee te sturen.
+    st.html('<style>@import url("app/static/style.css");</style>')
+
+def render_header():
     h1, h2 = st.columns([7, 2], vertical_alignment="center")
     with h1:
-        st.markdown(f"""
+        # Via enableStaticServing: de browser cachet het logo, i.p.v. ~90 KB base64 per rerun.
+        st.markdown("""
             <div class="custom-header">
-                <img src="data:image/webp;base64,{logo_b64}">
+                <img src="app/static/theunissen.webp">
                 <h1>Voorraad glas</h1>
             </div>
         """, unsafe_allow_html=True)
@@ -216,62 +1609,138 @@ def render_header(logo_b64: str):
             st.session_state.clear()
             st.rerun()
 
-def sync_selections():
-    if "main_editor" in st.session_state:
-        edits = st.session_state.main_editor.get("edited_rows", {})
-        df = st.session_state.app_state.mijn_data
-        for idx, changes in edits.items():
-            if "Selecteren" in changes:
-                rid = df.iloc[int(idx)]["id"]
-                if changes["Selecteren"]: st.session_state.app_state.selected_ids.add(rid)
-                else: st.session_state.app_state.selected_ids.discard(rid)
+def editor_sleutel(df: pd.DataFrame, buffer: EditBuffer) -> str:
+    """Widget-key per getoonde set ids en per buffer-generatie. Streamlit bewaart edited_rows op
+    rijpositie; met een vaste key zouden ze na bladeren of zoeken op de rijen van de nieuwe
+    pagina belanden, en na opslaan of annuleren opnieuw in de buffer komen."""
+    return f"main_editor_{buffer.generatie}_" + hashlib.sha1(df["id"].to_numpy().tobytes()).hexdigest()[:12]
+
+def sync_selections(sleutel: str):
+    """on_change van de editor, vóór de rerun: state.mijn_data is dan nog precies het frame
+    dat de gebruiker zag, dus hier worden de posities in edited_rows naar ids vertaald."""
+    state = st.session_state.app_state
+    df = state.mijn_data
+    for idx, changes in st.session_state[sleutel].get("edited_rows", {}).items():
+        rij = df.iloc[int(idx)]
+        rid = int(rij["id"])
+        if "Selecteren" in changes:
+            if changes["Selecteren"]: state.selectie.add(rid, rij)
+            else: state.selectie.discard(rid)
+        # Inline-wijzigingen gaan naar de buffer; opslaan gebeurt gebundeld (knop of autosave).
+        getoond = state.getoond.get(rid)
+        if getoond is None: continue
+        for kolom, waarde in changes.items():
+            if kolom != "Selecteren": state.edit_buffer.zet(rid, kolom, waarde, getoond)
+
+def sla_edits_op(service, automatisch: bool = False) -> bool:
+    state = st.session_state.app_state
+    try:
+        opgeslagen, conflicten = service.sla_edits_op(state.edit_buffer)
+    except BatchFout as e:
+        # Zoals voer_uit. De buffer blijft staan; na een mislukte autosave geen nieuwe automatische
+        # pogingen (elk met retries), alleen nog via OPSLAAN.
+        state.fout_msg = str(e) + (" Automatisch opslaan is gestopt; gebruik OPSLAAN." if automatisch else "")
+        if e.teruggedraaid: state.undo_log.pop()
+        if automatisch: state.edit_buffer.autosave = False
+        return False
+    if conflicten:
+        state.fout_msg = (f"{len(conflicten)} rij(en) zijn intussen door iemand anders gewijzigd of verwijderd; "
+                          f"die wijzigingen zijn niet opgeslagen (id {', '.join(map(str, conflicten[:10]))}"
+                          + (", ..." if len(conflicten) > 10 else "") + ").")
+    return opgeslagen > 0
+
+@st.fragment(run_every=EDIT_DEBOUNCE_SEC)
+def render_autosave(service):
+    """Slaat de edit-buffer op zodra er EDIT_DEBOUNCE_SEC niets meer is gewijzigd."""
+    buffer = st.session_state.app_state.edit_buffer
+    if buffer and buffer.autosave and time.time() - buffer.laatst >= EDIT_DEBOUNCE_SEC:
+        # Eén volledige rerun om het resultaat (of de fout) te tonen; daarna draait er niets meer tot er iets verandert.
+        sla_edits_op(service, automatisch=True)
+        st.rerun()
+
+def voer_uit(actie, *args) -> bool:
+    """Draait een alles-of-niets mutatie. Bij een fout blijft de melding tot de volgende rerun
+    staan, en verdwijnt de undo-stap als er niets is gewijzigd."""
+    state = st.session_state.app_state
+    try:
+        actie(*args)
+        return True
+    except BatchFout as e:
+        state.fout_msg = str(e)
+        if e.teruggedraaid: state.undo_log.pop()
+        return False
+
+def render_maat_zoek(state: AppState, c1, c2):
+    m = state.maat_zoek
+    m1, m2, m3, m4 = c1.columns([2, 2, 1, 3])
+    br = m1.number_input("Breedte", min_value=0, value=m.breedte or None, step=10, placeholder="Breedte (mm)", label_visibility="collapsed")
+    ho = m2.number_input("Hoogte", min_value=0, value=m.hoogte or None, step=10, placeholder="Hoogte (mm)", label_visibility="collapsed")
+    modus = m4.selectbox("Soort", options=list(MAAT_MODI), format_func=MAAT_MODI.get, index=list(MAAT_MODI).index(m.modus), label_visibility="collapsed")
+    marge = m3.number_input("Marge", min_value=0, value=m.marge, step=5, label_visibility="collapsed", disabled=modus != "marge", help="± mm")
+    nieuw = MaatZoek(int(br or 0), int(ho or 0), int(marge), modus)
+    if nieuw != m:
+        state.maat_zoek = nieuw; state.reset_paging(); st.rerun(scope="fragment")
+    if c2.button("WISSEN", use_container_width=True, key="clear_maat_btn", disabled=not m.actief):
+        state.maat_zoek = MaatZoek(); state.reset_paging(); st.rerun(scope="fragment")
 
 # =============================================================================
-# 5. GEOPTIMALISEERD INTERACTIEF BLOK
+# 7. GEOPTIMALISEERD INTERACTIEF BLOK
 # =============================================================================
 
 @st.fragment
-def render_main_interface(service):
+@gemeten("render.interface")
+def render_main_interface(service, presence: PresenceTracker):
     state = st.session_state.app_state
-    service.repo.update_online_status(state.gebruikersnaam)
+    meet = service.repo.metrics.meet
+    presence.touch(state.gebruikersnaam)
     
-    mensen = service.repo.get_online_users()
+    mensen = presence.online_users()
     if mensen:
         st.caption(f"🟢 Nu online: {', '.join(mensen)}")
 
-    c1, c2 = st.columns([7, 2])
-    zoek_val = c1.text_input("Zoeken", value=state.zoek_veld, placeholder="🔍 Zoek...", label_visibility="collapsed")
-    
-    if zoek_val != state.zoek_veld:
-        state.zoek_veld = zoek_val; state.current_page = 0; st.rerun(scope="fragment")
-        
-    if not state.zoek_veld:
-        if c2.button("ZOEKEN", use_container_width=True, key="search_btn"): st.rerun(scope="fragment")
+    c1, c2, c3 = st.columns([6, 2, 2])
+    maat_modus = state.zoek_modus == "maat"
+    if c3.button("🔤 TEKST" if maat_modus else "📐 MAAT", use_container_width=True, key="mode_btn"):
+        state.zoek_modus = "tekst" if maat_modus else "maat"; state.reset_paging(); st.rerun(scope="fragment")
+
+    if maat_modus:
+        render_maat_zoek(state, c1, c2)
     else:
-        if c2.button("WISSEN", use_container_width=True, key="clear_btn"):
-            state.zoek_veld = ""; state.current_page = 0; st.rerun(scope="fragment")
+        zoek_val = c1.text_input("Zoeken", value=state.zoek_veld, placeholder="🔍 Zoek...", label_visibility="collapsed")
+        
+        if zoek_val != state.zoek_veld:
+            state.zoek_veld = zoek_val; state.reset_paging(); st.rerun(scope="fragment")
+            
+        if not state.zoek_veld:
+            if c2.button("ZOEKEN", use_container_width=True, key="search_btn"): st.rerun(scope="fragment")
+        else:
+            if c2.button("WISSEN", use_container_width=True, key="clear_btn"):
+                state.zoek_veld = ""; state.reset_paging(); st.rerun(scope="fragment")
+    maat = state.maat_zoek if maat_modus else None
 
+    if state.fout_msg: st.error(state.fout_msg); state.fout_msg = ""
     actie_houder = st.container()
-    
-    with st.spinner("Laden..."):
-        state.mijn_data, state.total_count = service.laad_data(state.zoek_veld, state.current_page)
-    
-    curr_ids = set(state.mijn_data['id'].tolist())
-    sel_on = state.selected_ids.intersection(curr_ids)
-    sum_on = state.mijn_data[state.mijn_data['id'].isin(sel_on)]['aantal'].fillna(0).astype(int).sum()
-    
-    @st.cache_data(ttl=300)
-    def get_off_page_sum(ids_tuple):
-        if not ids_tuple: return 0
-        return service.repo.get_sum_aantal_for_ids(list(ids_tuple))
-    
-    sel_off = state.selected_ids.difference(curr_ids)
-    sum_off = get_off_page_sum(tuple(sorted(list(sel_off))))
-    totaal_sel = sum_on + sum_off
+
+    # Eén sync per rerun (in laad_data, met de reads parallel via gather); de koude start gebeurt maar één keer per proces.
+    with st.spinner("Laden..."), meet("render.laden"):
+        state.mijn_data, state.total_count = service.laad_data(state.zoek_veld, state.current_page, maat)
+        # Na verwijderen of een sync kan de huidige pagina achter de laatste liggen: die opnieuw laden.
+        laatste_pagina = max(0, -(-state.total_count // PAGE_SIZE) - 1)
+        if state.current_page > laatste_pagina:
+            state.current_page = laatste_pagina
+            state.mijn_data, state.total_count = service.laad_data(state.zoek_veld, state.current_page, maat)
+
+    selectie = state.selectie
+    selectie.ververs(service.store)
+    totaal_sel = selectie.ruiten
     suffix = f" ({totaal_sel})" if totaal_sel > 0 else ""
 
-    if state.selected_ids:
+    if selectie:
         with actie_houder:
+            st.caption(f"Selectie: {len(selectie)} regels · {selectie.ruiten} ruiten · {selectie.m2:.2f} m²")
+            if len(selectie.per_locatie) > 1:
+                with st.expander("Per locatie"):
+                    st.dataframe(selectie.tabel(), hide_index=True, use_container_width=True)
             b1, b2 = st.columns(2)
             if b1.button("❌ SLUIT" if state.show_location_grid else "📍 LOCATIE WIJZIGEN", use_container_width=True):
                 state.show_location_grid = not state.show_location_grid; st.rerun(scope="fragment")
@@ -285,13 +1754,12 @@ def render_main_interface(service):
                     mj1, mj2 = st.columns(2)
                     if mj1.button("Ja", use_container_width=True, type="primary"):
                         with st.spinner("Verwerken..."):
-                            service.push_undo_state(list(state.selected_ids))
-                            service.repo.delete_many(list(state.selected_ids))
-                            state.selected_ids.clear()
+                            service.push_undo_state(list(selectie), label="Verwijderd")
+                            if voer_uit(service.verwijder, list(selectie), voortgangsbalk("Verwijderen...")):
+                                selectie.clear()
+                                state.zoek_veld = ""
+                                state.reset_paging()
                             state.confirm_delete = False
-                            state.zoek_veld = ""
-                            state.current_page = 0
-                            service.trigger_mutation()
                             st.rerun(scope="fragment")
                     if mj2.button("Annuleer", use_container_width=True):
                         state.confirm_delete = False; st.rerun(scope="fragment")
@@ -301,9 +1769,10 @@ def render_main_interface(service):
                 al1, al2, al3 = st.columns([2, 1, 1])
                 if al1.button(f"🚀 VERPLAATS NAAR {state.bulk_loc}", type="primary", use_container_width=True):
                     with st.spinner("Verplaatsen..."):
-                        service.push_undo_state(list(state.selected_ids))
-                        service.repo.bulk_update_location(list(state.selected_ids), state.bulk_loc)
-                        service.trigger_mutation(); state.show_location_grid = False; st.rerun(scope="fragment")
+                        service.push_undo_state(list(selectie), ["locatie"], "Verplaatst")
+                        if voer_uit(service.verplaats, list(selectie), state.bulk_loc, voortgangsbalk("Verplaatsen...")):
+                            state.show_location_grid = False
+                        st.rerun(scope="fragment")
                 if al2.button("📍 Wijchen", use_container_width=True): state.loc_prefix = "W"; st.rerun(scope="fragment")
                 if al3.button("📍 Boxmeer", use_container_width=True): state.loc_prefix = "B"; st.rerun(scope="fragment")
                 
@@ -316,51 +1785,190 @@ def render_main_interface(service):
 
     cs1, cs2 = st.columns([1, 1])
     if cs1.button(f"✅ ALLES SELECTEREN{suffix}", use_container_width=True):
-        state.selected_ids.update(service.repo.get_all_matching_ids(state.zoek_veld)); st.rerun(scope="fragment")
+        selectie.update(service.store.get(service.matching_ids(state.zoek_veld, maat))); st.rerun(scope="fragment")
     if cs2.button(f"⬜ ALLES DESELECTEREN{suffix}", use_container_width=True):
-        state.selected_ids.clear(); st.rerun(scope="fragment")
-
-    st.data_editor(
-        state.mijn_data,
-        column_config={
-            "Selecteren": st.column_config.CheckboxColumn("Selecteer", width="small"),
-            "id": None,
-            "locatie": st.column_config.TextColumn("📍 Loc", width="small"),
-            "aantal": st.column_config.NumberColumn("Aant.", width="small")
-        },
-        hide_index=True, use_container_width=True, key="main_editor", height=600, disabled=["id"],
-        on_change=sync_selections
-    )
-
-    if "main_editor" in st.session_state:
-        edits = st.session_state.main_editor.get("edited_rows", {})
-        db_up = []
-        for idx, changes in edits.items():
-            clean = {k: v for k, v in changes.items() if k != "Selecteren"}
-            if clean: db_up.append({"id": int(state.mijn_data.iloc[int(idx)]["id"]), **clean})
-        if db_up:
+        selectie.clear(); st.rerun(scope="fragment")
+
+    editor_acties = st.container()
+    sleutel = editor_sleutel(state.mijn_data, state.edit_buffer)
+    with meet("render.editor"):
+        st.data_editor(
+            state.mijn_data,
+            column_config={
+                "Selecteren": st.column_config.CheckboxColumn("Selecteer", width="small"),
+                "id": None,
+                "locatie": st.column_config.TextColumn("📍 Loc", width="small"),
+                "aantal": st.column_config.NumberColumn("Aant.", width="small")
+            },
+            hide_index=True, use_container_width=True, key=sleutel, height=600, disabled=["id"],
+            on_change=sync_selections, args=(sleutel,)
+        )
+
+    aantal_paginas = max(1, -(-state.total_count // PAGE_SIZE))
+    if aantal_paginas > 1:
+        p1, p2, p3 = st.columns([1, 2, 1])
+        if p1.button("◀ VORIGE", use_container_width=True, disabled=state.current_page == 0, key="prev_page"):
+            state.current_page -= 1; st.rerun(scope="fragment")
+        p2.markdown(f"<div style='text-align:center'>Pagina {state.current_page + 1} van {aantal_paginas} · {state.total_count} ruiten</div>", unsafe_allow_html=True)
+        if p3.button("VOLGENDE ▶", use_container_width=True, disabled=state.current_page + 1 >= aantal_paginas, key="next_page"):
+            state.current_page += 1; st.rerun(scope="fragment")
+
+    if st.button("❌ SLUIT OVERZICHT" if state.show_overzicht else "🗺️ OVERZICHT PER LOCATIE", use_container_width=True, key="overzicht_btn"):
+        state.show_overzicht = not state.show_overzicht; st.rerun(scope="fragment")
+    if state.show_overzicht:
+        render_locatie_overzicht(service.store.locatie_overzicht())
+
+    buffer = state.edit_buffer
+    if buffer:
+        o1, o2 = editor_acties.columns([3, 1])
+        if o1.button(f"💾 OPSLAAN ({len(buffer)} wijzigingen)", type="primary", use_container_width=True, key="save_btn"):
             with st.spinner("Opslaan..."):
-                service.push_undo_state([r['id'] for r in db_up])
-                service.repo.bulk_update_fields(db_up); service.trigger_mutation(); st.rerun(scope="fragment")
+                sla_edits_op(service)
+            st.rerun(scope="fragment")
+        if o2.button("↩️ ANNULEER", use_container_width=True, key="discard_btn"):
+            buffer.clear(); st.rerun(scope="fragment")
+
+def render_locatie_overzicht(df: pd.DataFrame):
+    """Tegels per locatie, gegroepeerd per vestiging; leest alleen de bijgehouden totalen."""
+    vestigingen = {"Boxmeer": df[df["locatie"].str.match(r"B\d")], "Wijchen": df[df["locatie"].str.startswith("W")]}
+    vestigingen["Overig"] = df[~df.index.isin(vestigingen["Boxmeer"].index.union(vestigingen["Wijchen"].index))]
+    for naam, deel in vestigingen.items():
+        if deel.empty: continue
+        st.markdown(f"**{naam}** · {deel['regels'].sum()} regels · {deel['ruiten'].sum()} ruiten · {deel['m²'].sum():.1f} m²")
+        cols = st.columns(6)
+        for i, r in enumerate(deel.to_dict("records")):
+            with cols[i % 6].container(border=True):
+                sinds = f"<br>sinds {r['oudste'][:10]}" if isinstance(r["oudste"], str) else ""
+                st.markdown(f"<b>{r['locatie']}</b><br>{r['ruiten']} ruiten · {r['regels']} rg.<br>{r['m²']:.1f} m²{sinds}", unsafe_allow_html=True)
+
+def render_perf_panel(metrics: PerfMetrics):
+    """Alleen voor admins: p50/p95 per operatie uit de rollende metingen van dit proces."""
+    state = st.session_state.app_state
+    st.divider()
+    if st.button("❌ SLUIT PRESTATIES" if state.show_perf else "📊 PRESTATIES", use_container_width=True, key="perf_btn"):
+        state.show_perf = not state.show_perf; st.rerun()
+    if not state.show_perf: return
+    samenvatting = metrics.samenvatting()
+    if samenvatting.empty:
+        st.caption("Nog geen metingen.")
+    else:
+        st.dataframe(samenvatting.sort_values("p95 ms", ascending=False), hide_index=True, use_container_width=True)
+    k1, k2 = st.columns(2)
+    k1.download_button("⬇️ METINGEN (JSON)", metrics.export_json(), file_name=f"metingen_{datetime.now():%Y%m%d_%H%M}.json",
+                       mime="application/json", use_container_width=True)
+    if k2.button("🧹 METINGEN WISSEN", use_container_width=True, key="perf_reset"):
+        metrics.reset(); st.rerun()
+
+def render_toevoegen(service):
+    state = st.session_state.app_state
+    with st.form("add_form", clear_on_submit=True):
+        f1a, f1b = st.columns(2)
+        n_loc = f1a.selectbox("Locatie", options=LOCATIE_OPTIES)
+        n_aant = f1b.number_input("Aantal", min_value=1, value=1)
+        f1c, f1d = st.columns(2)
+        n_br = f1c.number_input("Breedte (mm)", min_value=0, value=0)
+        n_ho = f1d.number_input("Hoogte (mm)", min_value=0, value=0)
+        n_ord = st.text_input("Ordernummer")
+        n_oms = st.text_input("Omschrijving")
+        if st.form_submit_button("TOEVOEGEN", use_container_width=True):
+            with st.spinner("Toevoegen..."):
+                service.voeg_toe({"locatie": n_loc, "aantal": n_aant, "breedte": n_br if n_br > 0 else None, "hoogte": n_ho if n_ho > 0 else None, "order_nummer": n_ord.strip() or None, "omschrijving": n_oms.strip() or None})
+                state.success_msg = "Gelukt!"; st.rerun()
+
+def render_import(service):
+    state = st.session_state.app_state
+    up = st.file_uploader("Bulk import Excel (.xlsx)", type=["xlsx"], label_visibility="collapsed")
+    if up and st.button("🚀 IMPORT STARTEN", use_container_width=True):
+        try:
+            balk = st.progress(0.0, text="Importeren...")
+            def voortgang(nr, laatste):
+                balk.progress(min(nr / laatste, 1.0) if laatste else 0.0, text=f"Importeren... rij {nr}" + (f" van {laatste}" if laatste else ""))
+            state.import_resultaat = service.importeer_excel(up, voortgang)
+            st.rerun()
+        except Exception as e: st.error(f"Fout: {e}")
+
+def render_export(service):
+    state = st.session_state.app_state
+    e1, e2 = st.columns(2)
+    formaat = e1.selectbox("Formaat", options=export_formaten(), format_func=lambda f: EXPORT_FORMATEN[f][0], label_visibility="collapsed")
+    gefilterd = e2.checkbox(f"Alleen '{state.zoek_veld}'" if state.zoek_veld else "Alleen zoekterm", disabled=not state.zoek_veld)
+    zoekterm = state.zoek_veld if gefilterd else ""
+    # Uitgesteld: het bestand wordt pas gemaakt als er op de knop wordt gedrukt.
+    st.download_button("⬇️ DOWNLOAD", data=functools.partial(service.exporteer, zoekterm, formaat),
+                       file_name=f"voorraad_{datetime.now():%Y%m%d_%H%M}.{formaat}", mime=EXPORT_FORMATEN[formaat][1],
+                       use_container_width=True, key="export_btn")
+
+PANELEN = {"toevoegen": ("➕ NIEUWE RUIT", render_toevoegen), "import": ("📥 IMPORT", render_import), "export": ("📤 EXPORT", render_export)}
+
+@st.fragment
+@gemeten("render.footer")
+def render_footer(service):
+    """Toevoegen, import en export worden pas opgebouwd als ze open staan; openen en sluiten
+    herlaadt alleen dit blok."""
+    state = st.session_state.app_state
+    if state.success_msg: st.success(state.success_msg); state.success_msg = ""
+    knoppen = st.columns(len(PANELEN) + 1)
+    for kolom, (sleutel, (label, _)) in zip(knoppen, PANELEN.items()):
+        if kolom.button("❌ SLUIT" if state.paneel == sleutel else label, use_container_width=True, key=f"paneel_{sleutel}"):
+            state.paneel = None if state.paneel == sleutel else sleutel; st.rerun(scope="fragment")
+    if knoppen[-1].button("🔄 VERVERSEN", use_container_width=True, help="Data volledig opnieuw ophalen"):
+        with st.spinner("Verversen..."):
+            service.volledig_verversen(); st.rerun()
+    if state.paneel in PANELEN:
+        PANELEN[state.paneel][1](service)
+
+    if state.import_resultaat:
+        r = state.import_resultaat
+        st.info(f"Import: {r.gewijzigd} gewijzigd, {r.nieuw} nieuw, {r.ongewijzigd} ongewijzigd, {len(r.fouten)} fouten")
+        if r.fouten:
+            st.dataframe(pd.DataFrame(r.fouten), hide_index=True, use_container_width=True, height=min(35 * len(r.fouten) + 38, 300))
+        if st.button("Sluit importrapport", use_container_width=True, key="close_import"):
+            state.import_resultaat = None; st.rerun(scope="fragment")
+
+    if state.undo_log.laatste():
+        st.divider()
+        ls = state.undo_log.laatste()
+        st.write(f"Laatste actie om: **{ls.tijd}**" + (f" ({ls.label}, {len(ls.ids)} ruiten)" if ls.label else ""))
+        if not state.confirm_undo:
+            if st.button(f"⏪ TERUGZETTEN", use_container_width=True):
+                state.confirm_undo = True; st.rerun(scope="fragment")
+        else:
+            st.write("**Weet je het zeker? (Undo)**")
+            u1, u2 = st.columns(2)
+            if u1.button("Ja", use_container_width=True, type="primary", key="undo_yes"):
+                with st.spinner("Herstellen..."):
+                    try:
+                        weg = service.undo(voortgangsbalk("Herstellen..."))
+                        state.success_msg = "Hersteld!" + (f" ({weg} ruiten bestaan niet meer en zijn overgeslagen)" if weg else "")
+                    except BatchFout as e:
+                        state.fout_msg = str(e)
+                    state.confirm_undo = False; st.rerun()
+            if u2.button("Annuleer", use_container_width=True, key="undo_no"):
+                state.confirm_undo = False; st.rerun(scope="fragment")
 
 # =============================================================================
-# 6. MAIN EXECUTION
+# 8. MAIN EXECUTION
 # =============================================================================
 
 def main():
-    service = VoorraadService(GlasVoorraadRepository(init_supabase()))
+    metrics = init_metrics()
+    profiel = RerunProfiel(metrics, _SCRIPT_START)
+    repo = GlasVoorraadRepository(init_supabase(), metrics)
+    service = VoorraadService(repo, init_inventory_store(repo))
+
+    if "app_state" not in st.session_state:
+        # Na een refresh blijft de sessie ingelogd, maar zonder identiteit uit de URL: de undo-log
+        # op schijf (en het admin-paneel) komt pas terug na een echte login.
+        st.session_state.app_state = AppState(ingelogd=st.query_params.get("auth") == "true")
+    state = st.session_state.app_state
     
     if st.query_params.get("wake") == "true":
         wake_up_app(service)
         st.write("App is wakker geschud.")
         st.stop()
 
-    if "app_state" not in st.session_state: 
-        st.session_state.app_state = AppState(ingelogd=st.query_params.get("auth") == "true")
-    state = st.session_state.app_state
-
-    logo_b64 = get_base64_logo("theunissen.webp")
-    render_styling(logo_b64)
+    with profiel.sectie("styling"):
+        render_styling()
 
     # LOGIN LOGICA (Soepel & Autofill)
     login_placeholder = st.empty()
@@ -379,80 +1987,30 @@ def main():
                             if u_in in users and str(users[u_in]) == p_in:
                                 state.ingelogd = True
                                 state.gebruikersnaam = u_in
+                                state.undo_log = UndoLog.voor_gebruiker(u_in)
                                 st.query_params["auth"] = "true"
-                                service.repo.update_online_status(u_in)
+                                init_presence(service.repo).touch(u_in)
                                 st.rerun()
                             elif u_in:
                                 st.error("Inloggegevens onjuist")
-                        except: pass
+                        except Exception as e:
+                            service.repo.metrics.record("login", 0.0, fout=e)
+                            st.error(f"Inloggen mislukt: {e}")
         st.stop()
     
-    render_header(logo_b64)
-    render_main_interface(service)
+    with profiel.sectie("header"):
+        render_header()
+    with profiel.sectie("interface"):
+        render_main_interface(service, init_presence(repo))
+        render_autosave(service)
 
     st.divider()
-    f1, f2 = st.columns([1, 1])
-    with f1:
-        st.subheader("➕ Nieuwe ruit toevoegen")
-        if state.success_msg: st.success(state.success_msg); state.success_msg = ""
-        with st.form("add_form", clear_on_submit=True):
-            f1a, f1b = st.columns(2)
-            n_loc = f1a.selectbox("Locatie", options=LOCATIE_OPTIES)
-            n_aant = f1b.number_input("Aantal", min_value=1, value=1)
-            f1c, f1d = st.columns(2)
-            n_br = f1c.number_input("Breedte (mm)", min_value=0, value=0)
-            n_ho = f1d.number_input("Hoogte (mm)", min_value=0, value=0)
-            n_ord = st.text_input("Ordernummer")
-            n_oms = st.text_input("Omschrijving")
-            if st.form_submit_button("TOEVOEGEN", use_container_width=True):
-                with st.spinner("Toevoegen..."):
-                    service.repo.insert_one({"locatie": n_loc, "aantal": n_aant, "breedte": n_br if n_br > 0 else None, "hoogte": n_ho if n_ho > 0 else None, "order_nummer": n_ord.strip() or None, "omschrijving": n_oms.strip() or None})
-                    service.trigger_mutation(); state.success_msg = "Gelukt!"; st.rerun()
-
-    with f2:
-        st.subheader("📥 Bulk & Systeem")
-        up = st.file_uploader("Bulk import Excel (.xlsx)", type=["xlsx"], label_visibility="collapsed")
-        if up and st.button("🚀 IMPORT STARTEN", use_container_width=True):
-            try:
-                with st.spinner("Importeren..."):
-                    df_import = pd.read_excel(up)
-                    df_import.columns = [str(c).lower().strip().replace(' ', '_') for c in df_import.columns]
-                    if 'order' in df_import.columns: 
-                        df_import = df_import.rename(columns={'order': 'order_nummer'})
-                    for col in ['id', 'aantal', 'breedte', 'hoogte']:
-                        if col in df_import.columns:
-                            df_import[col] = pd.to_numeric(df_import[col], errors='coerce')
-                    df_import = df_import.astype(object).where(pd.notnull(df_import), None)
-                    db_cols = ["id", "locatie", "aantal", "breedte", "hoogte", "order_nummer", "omschrijving"]
-                    final_import = df_import[[c for c in df_import.columns if c in db_cols]]
-                    all_ids = [r['id'] for r in service.repo.get_all_for_backup()]
-                    service.push_undo_state(all_ids)
-                    service.repo.bulk_update_fields(final_import.to_dict('records'))
-                    service.trigger_mutation(); st.rerun()
-            except Exception as e: st.error(f"Fout: {e}")
-        
-        if st.button("🔄 DATA VOLLEDIG VERVERSEN", use_container_width=True):
-            with st.spinner("Verversen..."):
-                service.trigger_mutation(); st.rerun()
-        
-        if state.undo_stack:
-            st.divider()
-            ls = state.undo_stack[-1]
-            st.write(f"Laatste actie om: **{ls['tijd']}**")
-            if not state.confirm_undo:
-                if st.button(f"⏪ TERUGZETTEN", use_container_width=True):
-                    state.confirm_undo = True; st.rerun()
-            else:
-                st.write("**Weet je het zeker? (Undo)**")
-                u1, u2 = st.columns(2)
-                if u1.button("Ja", use_container_width=True, type="primary", key="undo_yes"):
-                    with st.spinner("Herstellen..."):
-                        undo_data = state.undo_stack.pop()["data"]
-                        clean_undo = [{k:v for k,v in r.items() if k != 'Selecteren'} for r in undo_data]
-                        service.repo.bulk_update_fields(clean_undo)
-                        state.confirm_undo = False
-                        service.trigger_mutation(); st.success("Hersteld!"); st.rerun()
-                if u2.button("Annuleer", use_container_width=True, key="undo_no"):
-                    state.confirm_undo = False; st.rerun()
+    with profiel.sectie("footer"):
+        render_footer(service)
+
+    if is_admin(state.gebruikersnaam):
+        with profiel.sectie("admin"):
+            render_perf_panel(repo.metrics)
+    profiel.afsluiten(tonen=st.query_params.get("profiel") == "1" or PROFIEL)
 
 if __name__ == "__main__": main()
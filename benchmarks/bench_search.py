@@ -0,0 +1,67 @@
+"""Vergelijkt de lokale n-gram index met een volledige ilike-scan.
+
+Gebruik:  python benchmarks/bench_search.py [aantal_rijen ...]
+
+De scan doet per rij wat Postgres voor `kolom ILIKE '%term%'` zonder
+bruikbare index doet: elke rij en elke zoekkolom aflopen.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from streamlit.logger import set_log_level  # noqa: E402
+
+set_log_level("error")  # geen bare-mode-waarschuwingen bij het importeren van app
+
+from app import LOCATIE_OPTIES, SEARCH_COLUMNS, SearchIndex  # noqa: E402
+
+TERMEN = ["b7", "w1", "hr", "ord0004", "12345", "triple", "zzz", "a"]
+
+
+def maak_rijen(n: int, seed: int = 42):
+    rnd = random.Random(seed)
+    soorten = ["HR++", "Triple", "Gelaagd 33.1", "Figuur 200", "Draadglas", "Spiegel"]
+    return [{
+        "id": i,
+        "locatie": rnd.choice(LOCATIE_OPTIES),
+        "aantal": rnd.randint(1, 10),
+        "breedte": rnd.randint(200, 3000),
+        "hoogte": rnd.randint(200, 3000),
+        "order_nummer": f"ORD{rnd.randint(0, n * 2):07d}",
+        "omschrijving": f"{rnd.choice(soorten)} {rnd.randint(4, 44)}mm",
+    } for i in range(1, n + 1)]
+
+
+def scan(rijen, term):
+    term = term.lower()
+    return [r["id"] for r in rijen if any(term in str(r.get(c) or "").lower() for c in SEARCH_COLUMNS)]
+
+
+def timed(fn, *args, herhaal=5):
+    beste = float("inf")
+    for _ in range(herhaal):
+        t0 = time.perf_counter()
+        res = fn(*args)
+        beste = min(beste, time.perf_counter() - t0)
+    return res, beste * 1000
+
+
+def main(groottes):
+    for n in groottes:
+        rijen = maak_rijen(n)
+        idx = SearchIndex()
+        _, bouw_ms = timed(idx.build, rijen, herhaal=1)
+        print(f"\n{n} rijen — index bouwen: {bouw_ms:.0f} ms")
+        print(f"{'term':<10}{'treffers':>10}{'scan ms':>12}{'index ms':>12}{'factor':>10}")
+        for term in TERMEN:
+            verwacht, scan_ms = timed(scan, rijen, term, herhaal=1)
+            gevonden, idx_ms = timed(idx.query, term)
+            assert gevonden == verwacht, f"afwijkend resultaat voor {term!r}"
+            print(f"{term:<10}{len(gevonden):>10}{scan_ms:>12.2f}{idx_ms:>12.3f}{scan_ms / max(idx_ms, 1e-6):>10.0f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [1_000, 10_000, 100_000])
@@ -0,0 +1,222 @@
+"""In-process stand-in voor de Supabase-client, voor benchmarks zonder productie.
+
+Implementeert alleen het deel van de postgrest query-builder dat
+GlasVoorraadRepository gebruikt: select (met count/head), or_ met ilike,
+eq/gt/gte/lt/in_, order, limit, insert, upsert, update, delete en execute.
+Elke execute() telt als één round-trip en kan een gesimuleerde latency krijgen.
+"""
+import bisect
+import itertools
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+SLEUTELS = {"active_sessions": "username"}
+
+
+class FakeResponse:
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data, self.count = data, count
+
+
+def _ilike(patroon: str):
+    regex = "".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in patroon)
+    return re.compile(f"^{regex}$", re.I | re.S)
+
+
+class FakeQuery:
+    def __init__(self, db: "FakeSupabase", tabel: str):
+        self.db, self.tabel = db, tabel
+        self.actie, self.payload = "select", None
+        self.kolommen, self.count, self.head = "*", None, False
+        self.filters, self.sortering, self.max_rijen = [], None, None
+        self.id_na = None
+
+    # --- builder -------------------------------------------------------------
+    def select(self, *kolommen, count=None, head=None):
+        self.kolommen, self.count, self.head = ",".join(kolommen) or "*", count, bool(head)
+        return self
+
+    def insert(self, records):
+        self.actie, self.payload = "insert", records
+        return self
+
+    def upsert(self, records, **_):
+        self.actie, self.payload = "upsert", records
+        return self
+
+    def update(self, waarden):
+        self.actie, self.payload = "update", waarden
+        return self
+
+    def delete(self):
+        self.actie = "delete"
+        return self
+
+    def _filter(self, fn):
+        self.filters.append(fn)
+        return self
+
+    def eq(self, kolom, waarde):
+        return self._filter(lambda r: r.get(kolom) == waarde)
+
+    def gt(self, kolom, waarde):
+        if kolom == "id": self.id_na = waarde
+        return self._filter(lambda r: r.get(kolom) is not None and r[kolom] > waarde)
+
+    def gte(self, kolom, waarde):
+        return self._filter(lambda r: r.get(kolom) is not None and r[kolom] >= waarde)
+
+    def lt(self, kolom, waarde):
+        return self._filter(lambda r: r.get(kolom) is not None and r[kolom] < waarde)
+
+    def in_(self, kolom, waarden):
+        waarden = set(waarden)
+        return self._filter(lambda r: r.get(kolom) in waarden)
+
+    def or_(self, expressie: str):
+        delen = []
+        for deel in expressie.split(","):
+            kolom, op, waarde = deel.split(".", 2)
+            if op != "ilike":
+                raise NotImplementedError(f"or_ ondersteunt alleen ilike, niet {op}")
+            delen.append((kolom, _ilike(waarde)))
+        return self._filter(lambda r: any(r.get(k) is not None and p.match(str(r[k])) for k, p in delen))
+
+    def order(self, kolom, desc=False):
+        self.sortering = (kolom, desc)
+        return self
+
+    def limit(self, n):
+        self.max_rijen = n
+        return self
+
+    # --- uitvoering ----------------------------------------------------------
+    def execute(self) -> FakeResponse:
+        self.db.round_trip()
+        with self.db.lock:
+            return getattr(self, f"_exec_{self.actie}")(self.db.tabellen.setdefault(self.tabel, {}))
+
+    def _match(self, rijen):
+        return [r for r in rijen.values() if all(f(r) for f in self.filters)]
+
+    def _exec_select(self, rijen):
+        max_rijen, aantal = min(self.max_rijen or self.db.max_rows, self.db.max_rows), None
+        if self.sortering == ("id", False) and not self.count:
+            gevonden = self._keyset(rijen, max_rijen)
+        else:
+            gevonden = self._match(rijen)
+            aantal = len(gevonden) if self.count else None
+            if self.head:
+                return FakeResponse([], aantal)
+            if self.sortering:
+                kolom, desc = self.sortering
+                gevonden.sort(key=lambda r: (r.get(kolom) is None, r.get(kolom)), reverse=desc)
+            gevonden = gevonden[:max_rijen]
+        if self.kolommen != "*":
+            kolommen = [k.strip() for k in self.kolommen.split(",")]
+            return FakeResponse([{k: r.get(k) for k in kolommen} for r in gevonden], aantal)
+        return FakeResponse([dict(r) for r in gevonden], aantal)
+
+    def _keyset(self, rijen, max_rijen):
+        """Snelle route voor `gt("id", x).order("id").limit(n)`: zoals een PK-index, O(pagina)."""
+        ids = self.db.gesorteerde_ids(self.tabel)
+        start = bisect.bisect_right(ids, self.id_na) if self.id_na is not None else 0
+        gevonden = []
+        for i in range(start, len(ids)):
+            r = rijen.get(ids[i])
+            if r is not None and all(f(r) for f in self.filters):
+                gevonden.append(r)
+                if len(gevonden) == max_rijen: break
+        return gevonden
+
+    def _exec_insert(self, rijen):
+        return self._exec_upsert(rijen)
+
+    def _exec_upsert(self, rijen):
+        records = self.payload if isinstance(self.payload, list) else [self.payload]
+        sleutel, nu, uit = SLEUTELS.get(self.tabel, "id"), self.db.nu(), []
+        for rec in records:
+            rec = dict(rec)
+            if rec.get(sleutel) is None:
+                rec[sleutel] = next(self.db.volgnummer)
+                rec.setdefault("created_at", nu)
+            rij = rijen.setdefault(rec[sleutel], {})
+            rij.update(rec)
+            rij["updated_at"] = nu
+            uit.append(dict(rij))
+        return FakeResponse(uit)
+
+    def _exec_update(self, rijen):
+        nu, gevonden = self.db.nu(), self._match(rijen)
+        for r in gevonden:
+            r.update(self.payload)
+            r["updated_at"] = nu
+        return FakeResponse([dict(r) for r in gevonden])
+
+    def _exec_delete(self, rijen):
+        gevonden = self._match(rijen)
+        sleutel = SLEUTELS.get(self.tabel, "id")
+        for r in gevonden:
+            del rijen[r[sleutel]]
+        return FakeResponse(gevonden)
+
+
+class FakeSupabase:
+    """Vervangt `supabase.Client`; `latency_ms` wordt per round-trip geslapen."""
+
+    def __init__(self, latency_ms: float = 0.0, max_rows: int = 1000):
+        self.latency_ms, self.max_rows = latency_ms, max_rows
+        self.tabellen: Dict[str, Dict[Any, Dict[str, Any]]] = {}
+        self.lock = threading.Lock()
+        self.round_trips = 0
+        self._id_cache: Dict[str, tuple] = {}
+        self.volgnummer = itertools.count(1)
+        self._start, self._t0 = datetime(2026, 1, 1, tzinfo=timezone.utc), time.monotonic()
+        self._klok = self._start
+
+    def table(self, naam: str) -> FakeQuery:
+        return FakeQuery(self, naam)
+
+    def round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def gesorteerde_ids(self, tabel: str) -> List[Any]:
+        rijen = self.tabellen.get(tabel, {})
+        sleutel = (len(rijen), next(reversed(rijen), None))
+        cache = self._id_cache.get(tabel)
+        if cache is None or cache[0] != sleutel:
+            cache = self._id_cache[tabel] = (sleutel, sorted(rijen))
+        return cache[1]
+
+    def nu(self) -> str:
+        """Loopt mee met de echte verstreken tijd (strikt oplopend), zodat alleen wat binnen
+        SYNC_OVERLAP_SEC is geschreven opnieuw in een delta-sync terugkomt, zoals in productie."""
+        echt = self._start + timedelta(seconds=time.monotonic() - self._t0)
+        self._klok = max(echt, self._klok + timedelta(microseconds=1))  # aanroepers houden self.lock al vast
+        return self._klok.isoformat()
+
+    def vul_voorraad(self, n: int, locaties: List[str], seed: int = 42):
+        rnd = random.Random(seed)
+        soorten = ["HR++", "Triple", "Gelaagd 33.1", "Figuur 200", "Draadglas", "Spiegel"]
+        tabel = self.tabellen.setdefault("glas_voorraad", {})
+        for _ in range(n):
+            # Bestaande voorraad: ingevoerd en laatst gewijzigd ergens in het afgelopen jaar.
+            rid = next(self.volgnummer)
+            created = self._start - timedelta(days=rnd.uniform(1, 365))
+            gewijzigd = rnd.random() < 0.3
+            updated = created + (self._start - created) * rnd.random() if gewijzigd else created
+            tabel[rid] = {
+                "id": rid, "locatie": rnd.choice(locaties), "aantal": rnd.randint(1, 10),
+                "breedte": rnd.randint(200, 3000), "hoogte": rnd.randint(200, 3000),
+                "order_nummer": f"ORD{rnd.randint(0, n * 2):07d}",
+                "omschrijving": f"{rnd.choice(soorten)} {rnd.randint(4, 44)}mm",
+                "created_at": created.isoformat(), "updated_at": updated.isoformat(),
+            }
+        return self
@@ -0,0 +1,125 @@
+"""Benchmark-suite voor de repository- en servicelaag tegen FakeSupabase.
+
+Gebruik:
+    python benchmarks/run_benchmarks.py                  # 1k, 10k, 100k rijen
+    python benchmarks/run_benchmarks.py 1000000 --latency-ms 40
+    python benchmarks/run_benchmarks.py --json resultaten.json
+
+Per operatie: wandtijd, aantal round-trips naar de (nep)database en de
+piek in Python-geheugen (tracemalloc; uit te zetten met --snel, want
+tracemalloc vertraagt zelf ook).
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import streamlit as st  # noqa: E402
+from streamlit.logger import set_log_level  # noqa: E402
+
+set_log_level("error")  # geen 'missing ScriptRunContext'-ruis buiten `streamlit run`
+
+import app  # noqa: E402
+from fake_supabase import FakeSupabase  # noqa: E402
+
+
+class Meting:
+    def __init__(self, client: FakeSupabase, geheugen: bool):
+        self.client, self.geheugen, self.resultaten = client, geheugen, []
+
+    def __call__(self, naam: str, fn, *args):
+        rt0 = self.client.round_trips
+        if self.geheugen:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            piek = tracemalloc.get_traced_memory()[1] / 1e6 if self.geheugen else None
+            if self.geheugen:
+                tracemalloc.stop()
+            self.resultaten.append({"operatie": naam, "ms": ms, "round_trips": self.client.round_trips - rt0, "piek_mb": piek})
+
+
+def maak_excel(store: app.InventoryStore, n: int) -> io.BytesIO:
+    """Werkblad met n bestaande rijen waarvan elke tiende een ander aantal krijgt."""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["id", "locatie", "aantal", "breedte", "hoogte", "order", "omschrijving"])
+    for i, rid in enumerate(store.sorted_ids()[:n]):
+        r = store.rows[rid]
+        ws.append([rid, r["locatie"], r["aantal"] + (1 if i % 10 == 0 else 0), r["breedte"], r["hoogte"], r["order_nummer"], r["omschrijving"]])
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf
+
+
+def draai(n: int, latency_ms: float, geheugen: bool):
+    client = FakeSupabase(latency_ms=latency_ms).vul_voorraad(n, app.LOCATIE_OPTIES)
+    repo = app.GlasVoorraadRepository(client)
+    service = app.VoorraadService(repo, app.InventoryStore(repo))
+    st.session_state.app_state = app.AppState()
+    meet = Meting(client, geheugen)
+
+    meet("laad_data (koud)", service.laad_data, "", 0)
+    meet("laad_data (rerun)", service.laad_data, "", 3)
+    meet("zoeken 'b7'", service.laad_data, "b7", 0)
+    meet("zoeken 'ord00012'", service.laad_data, "ord00012", 0)
+    meet("maat 800x1200 ±20", service.laad_data, "", 0, app.MaatZoek(800, 1200, 20, "marge"))
+    ids = meet("alles selecteren 'b'", service.matching_ids, "b")
+    verplaats = ids[:min(len(ids), 2000)]
+
+    def bulk_verplaatsen():
+        service.push_undo_state(verplaats, ["locatie"], "Verplaatst")
+        service.verplaats(verplaats, "W10")
+    meet(f"verplaatsen ({len(verplaats)})", bulk_verplaatsen)
+
+    weg = service.store.sorted_ids()[-min(n // 10, 500):]
+
+    def verwijderen():
+        service.push_undo_state(weg, label="Verwijderd")
+        service.verwijder(weg)
+    meet(f"verwijderen ({len(weg)})", verwijderen)
+    meet("undo verwijderen", service.undo)
+
+    import_rijen = min(n, 5000)
+    bestand = maak_excel(service.store, import_rijen)
+    meet(f"import ({import_rijen} rijen)", service.importeer_excel, bestand)
+    meet("undo import", service.undo)
+    meet("undo verplaatsen", service.undo)
+    return meet.resultaten
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("groottes", nargs="*", type=int, default=[1_000, 10_000, 100_000])
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="gesimuleerde latency per round-trip")
+    parser.add_argument("--snel", action="store_true", help="geen tracemalloc (zuiverder tijden, geen geheugen)")
+    parser.add_argument("--json", help="schrijf alle resultaten ook als JSON naar dit pad")
+    args = parser.parse_args()
+
+    alles = {}
+    for n in args.groottes:
+        resultaten = draai(n, args.latency_ms, not args.snel)
+        alles[n] = resultaten
+        print(f"\n{n:,} rijen (latency {args.latency_ms:g} ms/round-trip)")
+        print(f"{'operatie':<28}{'ms':>12}{'round-trips':>14}{'piek MB':>10}")
+        for r in resultaten:
+            piek = f"{r['piek_mb']:.1f}" if r["piek_mb"] is not None else "-"
+            print(f"{r['operatie']:<28}{r['ms']:>12.1f}{r['round_trips']:>14}{piek:>10}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"latency_ms": args.latency_ms, "resultaten": alles}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()